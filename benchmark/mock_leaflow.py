@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Leaflow 本地模拟服务器 - 用于离线基准测试
+同一端口同时模拟主站和签到站，按 Host 区分：
+    主站    http://127.0.0.1:端口   (/login, /dashboard, /api/...)
+    签到站  http://localhost:端口   (/, /frame, /checkin, /api/checkin)
+签到站通过 /oauth/authorize 跳转到主站换取登录态，模拟真实站点的授权流程。
+
+用法：python benchmark/mock_leaflow.py --port 8800 --variant iframe --latency 0.05
+"""
+
+import json
+import time
+import random
+import secrets
+import argparse
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+VARIANTS = ('plain', 'iframe', 'popup', 'already', 'captcha')
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta name="csrf-token" content="{token}"><title>{title}</title></head>
+<body>{body}</body></html>"""
+
+POPUP = """<div class="modal show" role="dialog" id="notice"
+    style="position:fixed;inset:0;background:rgba(0,0,0,.5);display:block"
+    onclick="this.remove()"><div class="modal-content" style="margin:20% auto;width:300px;background:#fff">公告</div></div>"""
+
+
+class MockState:
+    """服务器配置与内存状态（会话、今日已签到账号、请求计数）"""
+
+    def __init__(self, variant='plain', latency=0.0, jitter=0.0, fail_rate=0.0, password=None):
+        self.variant = variant
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        # 为None时接受任意密码；否则只接受该密码
+        self.password = password
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.checkin_sessions = {}
+        self.codes = {}
+        self.checked_in = {}
+        self.requests = 0
+        self.failures = 0
+
+    def new_session(self, table, email):
+        token = secrets.token_hex(16)
+        with self.lock:
+            table[token] = email
+        return token
+
+    def mark_checked_in(self, email):
+        with self.lock:
+            already = self.checked_in.get(email) == date.today()
+            self.checked_in[email] = date.today()
+        return not already
+
+    def is_checked_in(self, email):
+        return self.variant == 'already' or self.checked_in.get(email) == date.today()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None  # 由 make_server 绑定
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- 工具方法 ----
+
+    @property
+    def is_checkin_host(self):
+        return (self.headers.get('Host') or '').split(':')[0] == 'localhost'
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def main_url(self, path=''):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def checkin_url(self, path=''):
+        return f"http://localhost:{self.port}{path}"
+
+    def cookies(self):
+        jar = {}
+        for part in (self.headers.get('Cookie') or '').split(';'):
+            if '=' in part:
+                name, value = part.strip().split('=', 1)
+                jar[name] = value
+        return jar
+
+    def form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length).decode('utf-8') if length else ''
+        return {k: v[0] for k, v in parse_qs(raw).items()}
+
+    def send(self, status, body='', content_type='text/html; charset=utf-8', headers=None):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or []):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def redirect(self, location, headers=None):
+        self.send(302, '', headers=[('Location', location)] + list(headers or []))
+
+    def page(self, title, body, token=''):
+        self.send(200, PAGE.format(title=title, body=body, token=token))
+
+    def json(self, payload, status=200):
+        self.send(status, json.dumps(payload, ensure_ascii=False), 'application/json')
+
+    def current_user(self):
+        table = self.state.checkin_sessions if self.is_checkin_host else self.state.sessions
+        return table.get(self.cookies().get('mock_session', ''))
+
+    def inject(self):
+        """注入延迟和随机失败，返回True表示已发送失败响应"""
+        state = self.state
+        with state.lock:
+            state.requests += 1
+        delay = state.latency + random.uniform(0, state.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if state.fail_rate and random.random() < state.fail_rate:
+            with state.lock:
+                state.failures += 1
+            self.send(500, 'injected failure', 'text/plain')
+            return True
+        return False
+
+    # ---- 路由 ----
+
+    def do_GET(self):
+        if self.inject():
+            return
+        url = urlparse(self.path)
+        if url.path == '/favicon.ico':
+            return self.send(404, '', 'text/plain')
+        if self.is_checkin_host:
+            return self.checkin_get(url)
+        return self.main_get(url)
+
+    def do_POST(self):
+        if self.inject():
+            return
+        url = urlparse(self.path)
+        if self.is_checkin_host:
+            return self.checkin_post(url)
+        return self.main_post(url)
+
+    def main_get(self, url):
+        user = self.current_user()
+        if url.path == '/login':
+            token = secrets.token_hex(8)
+            popup = POPUP if self.state.variant == 'popup' else ''
+            captcha = '<div class="g-recaptcha" data-sitekey="mock"></div>' if self.state.variant == 'captcha' else ''
+            error = '<div class="alert-danger error">账号或密码错误</div>' if 'error' in url.query else ''
+            return self.page('登录', f"""{popup}{error}
+                <form method="post" action="/login">
+                  <input type="hidden" name="_token" value="{token}">
+                  <input type="email" name="email" placeholder="邮箱">
+                  <input type="password" name="password" placeholder="密码">
+                  {captcha}
+                  <button type="submit">登录</button>
+                </form>""", token)
+        if url.path in ('/', '/dashboard'):
+            if not user:
+                return self.redirect('/login')
+            return self.page('仪表板', f"""<nav><a href="{self.checkin_url()}">每日签到</a></nav>
+                <div class="card"><span class="label">账户余额</span>
+                <span class="font-medium balance">¥12.34</span></div>""")
+        if url.path == '/api/user/balance':
+            if not user:
+                return self.json({'message': 'Unauthenticated.'}, 401)
+            return self.json({'balance': '12.34', 'currency': 'CNY'})
+        if url.path == '/oauth/authorize':
+            redirect_to = parse_qs(url.query).get('redirect_uri', [self.checkin_url('/callback')])[0]
+            if not user:
+                return self.redirect('/login')
+            code = secrets.token_hex(8)
+            with self.state.lock:
+                self.state.codes[code] = user
+            return self.redirect(f"{redirect_to}?code={code}")
+        return self.send(404, 'not found', 'text/plain')
+
+    def main_post(self, url):
+        if url.path == '/login':
+            data = self.form()
+            if self.state.variant == 'captcha':
+                return self.redirect('/login?error=captcha')
+            email, password = data.get('email', ''), data.get('password', '')
+            if not data.get('_token') or not email or not password or \
+                    (self.state.password is not None and password != self.state.password):
+                return self.redirect('/login?error=1')
+            token = self.state.new_session(self.state.sessions, email)
+            return self.redirect('/dashboard', [('Set-Cookie', f'mock_session={token}; Path=/; HttpOnly')])
+        if url.path in ('/api/checkin', '/api/user/checkin', '/user/checkin'):
+            return self.api_checkin()
+        return self.send(404, 'not found', 'text/plain')
+
+    def checkin_get(self, url):
+        if url.path == '/callback':
+            code = parse_qs(url.query).get('code', [''])[0]
+            with self.state.lock:
+                email = self.state.codes.pop(code, None)
+            if not email:
+                return self.send(400, 'invalid code', 'text/plain')
+            token = self.state.new_session(self.state.checkin_sessions, email)
+            return self.redirect('/', [('Set-Cookie', f'mock_session={token}; Path=/; HttpOnly')])
+
+        user = self.current_user()
+        if not user:
+            callback = quote(self.checkin_url('/callback'), safe='')
+            return self.redirect(self.main_url(f'/oauth/authorize?redirect_uri={callback}'))
+
+        if url.path == '/' and self.state.variant == 'iframe':
+            return self.page('签到', '<h3>每日签到</h3><iframe src="/frame" width="600" height="300"></iframe>')
+        if url.path in ('/', '/frame'):
+            return self.page('签到', self.checkin_form(user))
+        return self.send(404, 'not found', 'text/plain')
+
+    def checkin_form(self, email):
+        if self.state.is_checked_in(email):
+            return '<div class="checkin"><button class="checkin-btn disabled" disabled>今日已签到</button></div>'
+        return """<form method="post" action="/checkin"><div class="checkin">
+            <button type="submit" class="checkin-btn">立即签到</button></div></form>"""
+
+    def checkin_post(self, url):
+        if url.path == '/api/checkin':
+            return self.api_checkin()
+        if url.path != '/checkin':
+            return self.send(404, 'not found', 'text/plain')
+        user = self.current_user()
+        if not user:
+            return self.redirect('/')
+        first = self.state.mark_checked_in(user)
+        message = '签到成功，获得 0.5 元' if first else '今日已签到'
+        if 'application/json' in (self.headers.get('Accept') or ''):
+            return self.json({'success': True, 'message': message})
+        self.page('签到结果', f"""<div class="alert-success toast">{message}</div>
+            <div class="checkin"><button class="checkin-btn disabled" disabled>今日已签到</button></div>""")
+
+    def api_checkin(self):
+        user = self.current_user()
+        if not user:
+            return self.json({'message': 'Unauthenticated.'}, 401)
+        first = self.state.mark_checked_in(user)
+        return self.json({'success': True, 'message': '签到成功' if first else '今日已签到'})
+
+
+def make_server(port=0, **options):
+    """创建（未启动的）模拟服务器，port=0 时自动分配端口"""
+    state = MockState(**options)
+    handler = type('BoundMockHandler', (MockHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def start_server(port=0, **options):
+    """在后台线程启动模拟服务器，返回 (server, 主站URL, 签到站URL)"""
+    server = make_server(port, **options)
+    thread = threading.Thread(target=server.serve_forever, name='mock-leaflow', daemon=True)
+    thread.start()
+    port = server.server_address[1]
+    return server, f"http://127.0.0.1:{port}", f"http://localhost:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leaflow 本地模拟服务器')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--variant', choices=VARIANTS, default='plain')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='额外的随机延迟上限（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='随机返回500的比例 0~1')
+    parser.add_argument('--password', default=None, help='只接受该密码，默认接受任意密码')
+    args = parser.parse_args()
+
+    server = make_server(args.port, variant=args.variant, latency=args.latency, jitter=args.jitter,
+                         fail_rate=args.fail_rate, password=args.password)
+    print(f"主站: http://127.0.0.1:{args.port}  签到站: http://localhost:{args.port}  变体: {args.variant}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Leaflow 签到离线基准测试
+启动本地模拟服务器，以子进程运行 leaflow_checkin.py，统计：
+    - 每个账号耗时 p50/p95（来自运行生成的 metrics JSON）
+    - 吞吐量（账号/分钟）
+    - 进程树（Python + chromedriver + Chrome）峰值内存
+
+用法：
+    python benchmark/run_benchmark.py                       # 1/10/100 个账号，HTTP路径
+    python benchmark/run_benchmark.py --engine browser --accounts 1,10 --workers 2
+    python benchmark/run_benchmark.py --variant iframe --latency 0.05 --fail-rate 0.02
+浏览器模式需要本机已安装 Chrome 和对应的 chromedriver（无需联网）。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+
+from mock_leaflow import VARIANTS, start_server  # noqa: E402
+from leaflow_checkin import percentile, process_tree_rss  # noqa: E402
+
+SCRIPT = os.path.join(ROOT, 'leaflow_checkin.py')
+
+
+def run_scenario(count, args, base_url, checkin_url):
+    state_dir = tempfile.mkdtemp(prefix='leaflow-bench-')
+    metrics_path = os.path.join(state_dir, 'metrics.json')
+    env = dict(os.environ)
+    env.update({
+        'LEAFLOW_ACCOUNTS': ','.join(f'bench{i}@example.com:password{i}' for i in range(count)),
+        'LEAFLOW_BASE_URL': base_url,
+        'LEAFLOW_CHECKIN_URL': checkin_url,
+        'LEAFLOW_STATE_DIR': state_dir,
+        'LEAFLOW_METRICS_JSON': metrics_path,
+        'LEAFLOW_HTTP_FIRST': '1' if args.engine == 'http' else '0',
+        'LEAFLOW_WORKERS': str(args.workers),
+        'GITHUB_ACTIONS': 'true',
+        'TELEGRAM_BOT_TOKEN': '',
+        'TELEGRAM_CHAT_ID': '',
+        'NO_PROXY': '127.0.0.1,localhost',
+    })
+    if args.use_async:
+        env['LEAFLOW_ASYNC'] = '1'
+    if args.rate_limit is not None:
+        env['LEAFLOW_RATE_LIMIT'] = str(args.rate_limit)
+    env.pop('LEAFLOW_EMAIL', None)
+    env.pop('LEAFLOW_PASSWORD', None)
+
+    log = open(os.path.join(state_dir, 'run.log'), 'w')
+    started = time.monotonic()
+    proc = subprocess.Popen([sys.executable, SCRIPT], env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], process_tree_rss(proc.pid))
+            done.wait(0.2)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        proc.wait(timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    wall = time.monotonic() - started
+    done.set()
+    sampler.join()
+    log.close()
+
+    try:
+        with open(metrics_path, encoding='utf-8') as f:
+            metrics = json.load(f)
+    except (OSError, ValueError):
+        metrics = {'accounts': {}}
+    accounts = metrics.get('accounts', {})
+    durations = [a['duration'] for a in accounts.values() if 'duration' in a]
+    succeeded = sum(1 for a in accounts.values() if a.get('success'))
+
+    return {
+        'accounts': count,
+        'succeeded': succeeded,
+        'exit_code': proc.returncode,
+        'wall_seconds': round(wall, 2),
+        'accounts_per_minute': round(count / wall * 60, 1) if wall else 0.0,
+        'latency_p50': round(percentile(durations, 0.5), 3),
+        'latency_p95': round(percentile(durations, 0.95), 3),
+        'peak_rss_mb': round(peak[0] / 1024 / 1024, 1),
+        'phases': metrics.get('phases', []),
+        'log': log.name,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leaflow 签到离线基准测试')
+    parser.add_argument('--accounts', default='1,10,100', help='逗号分隔的账号数量，默认 1,10,100')
+    parser.add_argument('--engine', choices=('http', 'browser'), default='http')
+    parser.add_argument('--workers', type=int, default=4, help='LEAFLOW_WORKERS，默认 4')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='使用 LEAFLOW_ASYNC=1 调度')
+    parser.add_argument('--rate-limit', type=float, help='LEAFLOW_RATE_LIMIT，0 表示不限速，默认使用脚本默认值')
+    parser.add_argument('--variant', choices=VARIANTS, default='plain')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=1800, help='单个场景的超时（秒）')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    args = parser.parse_args()
+
+    rows = []
+    for count in [int(c) for c in args.accounts.split(',') if c.strip()]:
+        # 每个场景使用全新的服务器状态，避免"今日已签到"影响结果
+        server, base_url, checkin_url = start_server(
+            variant=args.variant, latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate
+        )
+        try:
+            row = run_scenario(count, args, base_url, checkin_url)
+        finally:
+            server.shutdown()
+            server.server_close()
+        row['server_requests'] = server.state.requests
+        rows.append(row)
+        print(f"[{args.engine}] {count:>4} 个账号: {row['succeeded']}/{count} 成功, "
+              f"{row['wall_seconds']}s, {row['accounts_per_minute']} 账号/分钟, "
+              f"p50={row['latency_p50']}s p95={row['latency_p95']}s, 峰值内存 {row['peak_rss_mb']} MB")
+
+    print()
+    print(f"{'账号数':>6} {'成功':>6} {'耗时(s)':>9} {'账号/分钟':>10} {'p50(s)':>8} {'p95(s)':>8} {'峰值MB':>8} {'请求数':>7}")
+    for row in rows:
+        print(f"{row['accounts']:>6} {row['succeeded']:>6} {row['wall_seconds']:>9} {row['accounts_per_minute']:>10} "
+              f"{row['latency_p50']:>8} {row['latency_p95']:>8} {row['peak_rss_mb']:>8} {row['server_requests']:>7}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'engine': args.engine, 'variant': args.variant, 'workers': args.workers, 'results': rows},
+                      f, ensure_ascii=False, indent=1)
+
+
+if __name__ == '__main__':
+    main()
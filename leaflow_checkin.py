@@ -6,24 +6,2081 @@ Leaflow 多账号自动签到脚本 - 增强调试版
 """
 
 import os
+import re
+import sys
+import csv
+import json
+import gzip
+import html
 import time
+import queue
+import random
+import signal
+import socket
+import base64
+import sqlite3
+import hashlib
 import logging
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import TimeoutException
+import argparse
+import importlib
+import functools
+import contextlib
+import threading
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, unquote, urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+
+class StartupProfile:
+    """启动耗时：解释器启动（含顶层导入）、模块加载、首次网络请求、首次加载Selenium、首个浏览器可用（均为相对进程启动的秒数）"""
+    
+    def __init__(self):
+        # 计时起点为顶层导入完成之后；之前的时间（解释器启动和导入）由 interpreter 阶段按进程启动时刻补上
+        self.started = time.perf_counter()
+        self.started_boottime = time.clock_gettime(time.CLOCK_BOOTTIME) if hasattr(time, 'CLOCK_BOOTTIME') else None
+        self.marks = {}
+        self.imports = {}
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def interpreter_seconds(started_boottime):
+        """进程启动到顶层导入完成的耗时（/proc 中的进程启动时刻与开机时钟比较，非Linux平台返回None）"""
+        if started_boottime is None:
+            return None
+        try:
+            with open('/proc/self/stat', 'rb') as f:
+                start_ticks = int(f.read().rsplit(b')', 1)[1].split()[19])
+            return max(0.0, started_boottime - start_ticks / os.sysconf('SC_CLK_TCK'))
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+    
+    def mark(self, stage):
+        """记录某个阶段第一次发生的时间，之后的调用忽略"""
+        if stage in self.marks:
+            return
+        with self.lock:
+            self.marks.setdefault(stage, time.perf_counter() - self.started)
+    
+    def record_import(self, name, seconds):
+        with self.lock:
+            self.imports[name] = self.imports.get(name, 0.0) + seconds
+    
+    def to_dict(self):
+        interpreter = self.interpreter_seconds(self.started_boottime)
+        offset = interpreter or 0.0
+        with self.lock:
+            stages = {stage: round(offset + value, 4) for stage, value in self.marks.items()}
+            imports = {name: round(value, 4) for name, value in self.imports.items()}
+        if interpreter is not None:
+            stages['interpreter'] = round(interpreter, 4)
+        return {'stages': stages, 'lazy_imports': imports}
+    
+    def log_summary(self):
+        profile = self.to_dict()
+        parts = [f"{stage}={value * 1000:.0f}ms" for stage, value in sorted(profile['stages'].items(), key=lambda x: x[1])]
+        parts += [f"import {name}={value * 1000:.0f}ms" for name, value in profile['lazy_imports'].items()]
+        logger.info(f"🚀 启动耗时: {', '.join(parts)}")
+
+
+_startup_profile = StartupProfile()
+
+
+def get_startup_profile():
+    return _startup_profile
+
+
+class LazyImport:
+    """首次使用时才导入的模块或对象。HTTP路径和被跳过的账号用不到Selenium和asyncio，不必为导入付出启动时间"""
+    
+    def __init__(self, module, attr=None):
+        self._module = module
+        self._attr = attr
+        self._target = None
+    
+    def _load(self):
+        if self._target is None:
+            started = time.perf_counter()
+            target = importlib.import_module(self._module)
+            if self._attr:
+                target = getattr(target, self._attr)
+            get_startup_profile().record_import(self._module.split('.')[0], time.perf_counter() - started)
+            self._target = target
+        return self._target
+    
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+    
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+
+asyncio = LazyImport('asyncio')
+webdriver = LazyImport('selenium.webdriver')
+By = LazyImport('selenium.webdriver.common.by', 'By')
+WebDriverWait = LazyImport('selenium.webdriver.support.ui', 'WebDriverWait')
+EC = LazyImport('selenium.webdriver.support.expected_conditions')
+Options = LazyImport('selenium.webdriver.chrome.options', 'Options')
+ActionChains = LazyImport('selenium.webdriver.common.action_chains', 'ActionChains')
+
+
+def selenium_timeout():
+    """Selenium的TimeoutException。except 子句中的表达式只在异常发生时求值，因此不会提前导入Selenium"""
+    from selenium.common.exceptions import TimeoutException
+    return TimeoutException
+
+
+# 站点地址，可指向本地模拟服务器（见 benchmark/mock_leaflow.py）
+LEAFLOW_URL = os.getenv('LEAFLOW_BASE_URL', 'https://leaflow.net').rstrip('/')
+CHECKIN_URL = os.getenv('LEAFLOW_CHECKIN_URL', 'https://checkin.leaflow.net').rstrip('/')
+LEAFLOW_HOST = urlparse(LEAFLOW_URL).hostname
+CHECKIN_HOST = urlparse(CHECKIN_URL).hostname
+
+# 运行状态目录（会话缓存等），GitHub Actions 中通过 actions/cache 跨运行保留
+STATE_DIR = os.getenv('LEAFLOW_STATE_DIR', '.leaflow_state')
+
+
+def env_number(name, default, cast=float):
+    """读取数值型环境变量；留空时使用默认值，格式错误时记录警告后使用默认值（不让导入失败）"""
+    value = os.getenv(name, '').strip()
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        logger.warning(f"⚠️ {name}={value} 格式错误，使用默认值 {default}")
+        return default
+
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+
+class TokenBucket:
+    """单个主机的令牌桶。速率按 AIMD 自适应：被限流（429/5xx）时减半，之后每个正常响应逐步恢复到上限"""
+    
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.min_rate = max(rate / 16, 0.1)
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """取一个令牌，必要时阻塞等待；返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+    
+    def throttle(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+    
+    def relax(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class HostRateLimiter:
+    """按主机限制请求速率（HTTP请求和浏览器导航共用），替代账号之间的固定等待。
+    
+    默认不限速（Telegram除外）；未配置限速的主机第一次返回 429/5xx 时才按 THROTTLED_START_RATE 开始限速，
+    之后按 AIMD 自适应。LEAFLOW_RATE_LIMIT 可为所有主机设置固定上限。
+    """
+    
+    THROTTLED_START_RATE = 10.0
+    
+    def __init__(self):
+        self.default_rate = env_number('LEAFLOW_RATE_LIMIT', 0.0)
+        self.burst = env_number('LEAFLOW_RATE_BURST', 5.0)
+        # Telegram 对同一个会话限制约每秒1条消息
+        self.rates = {'api.telegram.org': 1.0}
+        for item in os.getenv('LEAFLOW_RATE_LIMITS', '').split(','):
+            if '=' not in item:
+                continue
+            host, value = item.split('=', 1)
+            try:
+                self.rates[host.strip()] = float(value)
+            except ValueError:
+                logger.warning(f"⚠️ 限速配置格式错误: {item}")
+        self.buckets = {}
+        self.lock = threading.Lock()
+    
+    def bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                rate = self.rates.get(host, self.default_rate)
+                self.buckets[host] = TokenBucket(rate, min(self.burst, max(rate, 1))) if rate > 0 else None
+            return self.buckets[host]
+    
+    def acquire(self, host):
+        bucket = self.bucket(host) if host else None
+        return bucket.acquire() if bucket else 0.0
+    
+    def feedback(self, host, status_code, retry_after=None):
+        if not host:
+            return
+        throttled = status_code == 429 or status_code in (502, 503, 504)
+        bucket = self.bucket(host)
+        if bucket is None:
+            if not throttled or host in self.rates:
+                return
+            # 未配置限速的主机开始反压：从这里开始限速
+            with self.lock:
+                bucket = self.buckets.get(host)
+                if bucket is None:
+                    bucket = self.buckets[host] = TokenBucket(self.THROTTLED_START_RATE,
+                                                              min(self.burst, self.THROTTLED_START_RATE))
+        if throttled:
+            bucket.throttle(parse_retry_after(retry_after))
+            logger.warning(f"⚠️ {host} 返回 HTTP {status_code}，降低请求速率至 {bucket.rate:.2f}/s")
+        else:
+            bucket.relax()
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头（只支持秒数），最多等待 120 秒"""
+    try:
+        return min(120.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+_rate_limiter = HostRateLimiter()
+
+
+def get_rate_limiter():
+    return _rate_limiter
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """发送前按主机取令牌，并把响应状态反馈给限速器"""
+    
+    def send(self, request, **kwargs):
+        get_startup_profile().mark('first_request')
+        host = urlparse(request.url).hostname
+        limiter = get_rate_limiter()
+        limiter.acquire(host)
+        response = super().send(request, **kwargs)
+        limiter.feedback(host, response.status_code, response.headers.get('Retry-After'))
+        return response
+    
+    def close(self):
+        """适配器由所有Session共享，单个Session.close()不能清空其他账号正在使用的连接池；
+        进程退出前由 close_http_pool() 统一关闭"""
+    
+    def shutdown(self):
+        super().close()
+
+
+# 所有账号共用一个连接池，cookie仍按账号隔离在各自的Session中
+_HTTP_ADAPTER = RateLimitedAdapter(pool_connections=4, pool_maxsize=32)
+
+
+def close_http_pool():
+    """关闭共享连接池（进程退出前调用一次）"""
+    _HTTP_ADAPTER.shutdown()
+
+
+def create_http_session():
+    """创建挂载共享连接池的requests.Session"""
+    session = requests.Session()
+    session.mount('https://', _HTTP_ADAPTER)
+    session.mount('http://', _HTTP_ADAPTER)
+    session.headers.update({
+        'User-Agent': USER_AGENT,
+        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    })
+    return session
+
+
+def local_now():
+    """按 LEAFLOW_TZ（默认 Asia/Shanghai）计算的当前时间，签到按该时区的自然日重置"""
+    tz_name = os.getenv('LEAFLOW_TZ', 'Asia/Shanghai')
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo(tz_name))
+    except Exception:
+        if tz_name == 'Asia/Shanghai':
+            return datetime.now(timezone(timedelta(hours=8)))
+        logger.warning(f"⚠️ 无法加载时区 {tz_name}，使用系统本地时区")
+        return datetime.now().astimezone()
+
+
+def mask_email(email):
+    """隐藏邮箱部分字符以保护隐私"""
+    return email[:3] + "***" + email[email.find("@"):]
+
+
+def account_key(email):
+    """账号的稳定标识，用于状态文件命名，避免在磁盘上暴露邮箱"""
+    return hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()[:16]
+
+
+def account_label(email):
+    """报告中使用的账号标签：脱敏邮箱加短哈希，前缀相同的邮箱也不会冲突"""
+    return f"{mask_email(email)}#{account_key(email)[:6]}"
+
+
+class SessionCache:
+    """按账号持久化登录cookies，会话仍有效时跳过登录流程"""
+    
+    _warned = False
+    
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(STATE_DIR, 'sessions')
+        self.enabled = os.getenv('LEAFLOW_SESSION_CACHE', '1').strip() != '0'
+        self.ttl = env_number('LEAFLOW_SESSION_TTL_HOURS', 24.0) * 3600
+        self.fernet = None
+        
+        key = os.getenv('LEAFLOW_SESSION_KEY', '').strip()
+        if self.enabled and key:
+            try:
+                from cryptography.fernet import Fernet
+                # 任意口令派生为Fernet所需的32字节密钥
+                self.fernet = Fernet(base64.urlsafe_b64encode(hashlib.sha256(key.encode('utf-8')).digest()))
+            except ImportError:
+                logger.warning("⚠️ 已设置 LEAFLOW_SESSION_KEY 但未安装 cryptography，禁用会话缓存")
+                self.enabled = False
+        elif self.enabled and os.getenv('GITHUB_ACTIONS'):
+            # Actions缓存可被其他分支/PR的运行读取，CI中不保存明文cookie
+            if not SessionCache._warned:
+                logger.warning("⚠️ GitHub Actions 中未设置 LEAFLOW_SESSION_KEY，禁用会话缓存")
+                SessionCache._warned = True
+            self.enabled = False
+    
+    def _path(self, email):
+        return os.path.join(self.directory, f"{account_key(email)}.session")
+    
+    def load(self, email):
+        """读取未过期的cookies，不存在或已过期返回None"""
+        if not self.enabled:
+            return None
+        path = self._path(email)
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.debug(f"读取会话缓存失败: {e}")
+            return None
+        
+        try:
+            if self.fernet:
+                raw = self.fernet.decrypt(raw)
+            data = json.loads(raw.decode('utf-8'))
+        except Exception as e:
+            logger.warning(f"会话缓存无法解析，已丢弃: {e}")
+            self.invalidate(email)
+            return None
+        
+        if data.get('expires_at', 0) <= time.time():
+            logger.info("会话缓存已过期")
+            self.invalidate(email)
+            return None
+        return data.get('cookies') or None
+    
+    def save(self, email, cookies):
+        """保存cookies，过期时间取TTL与cookie自身过期时间中较早者"""
+        if not self.enabled or not cookies:
+            return
+        expires_at = time.time() + self.ttl
+        cookie_expiries = [c['expires'] for c in cookies if c.get('expires', -1) > 0]
+        if cookie_expiries:
+            expires_at = min(expires_at, max(cookie_expiries))
+        
+        raw = json.dumps({'saved_at': time.time(), 'expires_at': expires_at, 'cookies': cookies}).encode('utf-8')
+        if self.fernet:
+            raw = self.fernet.encrypt(raw)
+        
+        path = self._path(email)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+            logger.info("已保存会话缓存")
+        except OSError as e:
+            logger.warning(f"保存会话缓存失败: {e}")
+    
+    def invalidate(self, email):
+        try:
+            os.remove(self._path(email))
+        except OSError:
+            pass
+    
+    @staticmethod
+    def apply_to_session(session, cookies):
+        """把缓存的cookies写入requests.Session"""
+        for c in cookies:
+            session.cookies.set(c['name'], c['value'], domain=c.get('domain', ''), path=c.get('path', '/'))
+    
+    @staticmethod
+    def is_valid(cookies, timeout=10):
+        """用一次带cookie的请求检查会话是否仍然登录"""
+        session = create_http_session()
+        SessionCache.apply_to_session(session, cookies)
+        try:
+            response = session.get(f"{LEAFLOW_URL}/dashboard", allow_redirects=False, timeout=timeout)
+        except Exception as e:
+            logger.debug(f"会话校验请求失败: {e}")
+            return False
+        finally:
+            session.close()
+        
+        location = response.headers.get('Location', '')
+        return response.status_code == 200 and 'login' not in location
+
+
+class HttpChallengeError(Exception):
+    """HTTP路径遇到无法处理的情况（验证码、JS挑战、未知页面结构），需要回退到浏览器"""
+
+
+class HttpTransientError(HttpChallengeError):
+    """服务端临时错误（5xx），稍后重试通常可以恢复"""
+
+
+class HttpThrottledError(HttpChallengeError):
+    """被限流（HTTP 429），按 Retry-After 或退避时间等待后重试"""
+    
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LoginFailedError(Exception):
+    """账号或密码错误等确定性的登录失败，换用浏览器也无法解决"""
+
+
+def classify_failure(error):
+    """失败类型：transient / throttled 可以重试，challenge 需要换用浏览器，fatal 直接失败"""
+    if isinstance(error, LoginFailedError):
+        return 'fatal'
+    if isinstance(error, HttpThrottledError):
+        return 'throttled'
+    if isinstance(error, HttpTransientError):
+        return 'transient'
+    if isinstance(error, HttpChallengeError):
+        return 'challenge'
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return 'transient'
+    if 'selenium' in sys.modules and isinstance(error, selenium_timeout()):
+        return 'transient'
+    return 'fatal'
+
+
+class RetryPolicy:
+    """指数退避加随机抖动的重试策略，只重试 transient / throttled 类失败"""
+    
+    RETRYABLE = ('transient', 'throttled')
+    
+    def __init__(self, attempts=3, base=1.0, cap=30.0, jitter=0.5):
+        self.attempts = max(1, int(attempts))
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+    
+    def delay(self, attempt, retry_after=None):
+        """第 attempt 次（从0开始）失败后的等待时间"""
+        delay = min(self.cap, self.base * (2 ** attempt))
+        delay *= 1 - random.uniform(0, self.jitter)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+    
+    def backoff(self, error, attempt):
+        """失败可以重试时返回等待秒数，否则返回None"""
+        if attempt + 1 >= self.attempts or classify_failure(error) not in self.RETRYABLE:
+            return None
+        return self.delay(attempt, getattr(error, 'retry_after', None))
+    
+    def call(self, func, *args, on_retry=None):
+        attempt = 0
+        while True:
+            try:
+                return func(*args)
+            except Exception as e:
+                delay = self.backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                logger.warning(f"{classify_failure(e)} 失败，{delay:.1f}秒后第 {attempt + 1}/{self.attempts} 次尝试: {e}")
+                if on_retry:
+                    on_retry(attempt + 1)
+                time.sleep(delay)
+
+
+# 各类操作的重试策略：(尝试次数, 退避基数秒, 退避上限秒)，可通过 LEAFLOW_RETRY 覆盖，如 http_step=4:1:20
+DEFAULT_RETRY_POLICIES = {
+    'http_step': (3, 1.0, 20.0),
+    'checkin_page': (5, 1.0, 15.0),
+    'notification': (4, 1.0, 30.0),
+}
+
+
+def load_retry_policies():
+    policies = {name: RetryPolicy(*spec) for name, spec in DEFAULT_RETRY_POLICIES.items()}
+    for item in os.getenv('LEAFLOW_RETRY', '').split(','):
+        if '=' not in item:
+            continue
+        name, value = item.split('=', 1)
+        try:
+            spec = [float(v) for v in value.split(':')]
+            policies[name.strip()] = RetryPolicy(*spec[:3])
+        except (TypeError, ValueError):
+            logger.warning(f"⚠️ 重试策略格式错误: {item}")
+    return policies
+
+
+_retry_policies = load_retry_policies()
+
+
+def get_retry_policy(name):
+    return _retry_policies.get(name) or RetryPolicy()
+
+
+class _FormParser(HTMLParser):
+    """提取页面中的表单、csrf meta和可见文本"""
+    
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.meta = {}
+        self.text_parts = []
+        self._form = None
+        self._button = None
+        self._skip = 0
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag == 'meta' and attrs.get('name'):
+            self.meta[attrs['name']] = attrs.get('content', '')
+        elif tag == 'form':
+            self._form = {'action': attrs.get('action', ''), 'method': (attrs.get('method') or 'get').lower(),
+                          'inputs': {}, 'fields': [], 'buttons': []}
+            self.forms.append(self._form)
+        elif tag == 'input' and self._form is not None:
+            if attrs.get('name'):
+                self._form['inputs'][attrs['name']] = attrs.get('value', '')
+                self._form['fields'].append({'name': attrs['name'], 'type': (attrs.get('type') or 'text').lower(),
+                                             'placeholder': attrs.get('placeholder', '')})
+            if attrs.get('type') == 'submit':
+                self._form['buttons'].append({'text': attrs.get('value', ''), 'disabled': 'disabled' in attrs})
+        elif tag == 'button':
+            self._button = {'text': '', 'disabled': 'disabled' in attrs, 'class': attrs.get('class', '')}
+            if self._form is not None:
+                self._form['buttons'].append(self._button)
+    
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+        elif tag == 'form':
+            self._form = None
+        elif tag == 'button':
+            self._button = None
+    
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._button is not None:
+            self._button['text'] += data.strip()
+        if data.strip():
+            self.text_parts.append(data.strip())
+    
+    @property
+    def text(self):
+        return '\n'.join(self.text_parts)
+
+
+def parse_page(html):
+    parser = _FormParser()
+    parser.feed(html)
+    return parser
+
+
+BALANCE_PATTERN = re.compile(r'[¥￥]\s*([\d,]+(?:\.\d+)?)|([\d,]+(?:\.\d+)?)\s*元')
+
+# 在页面内一次完成余额查找：定位第一个含货币符号的文本节点，再用其父元素的完整文本匹配金额
+BALANCE_SCRIPT = r"""
+const pattern = /[¥￥]\s*([\d,]+(?:\.\d+)?)|([\d,]+(?:\.\d+)?)\s*元/;
+if (!document.body) return null;
+const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+while (walker.nextNode()) {
+    const node = walker.currentNode;
+    if (!/[¥￥元]/.test(node.nodeValue)) continue;
+    const parent = node.parentElement;
+    if (!parent || ['SCRIPT', 'STYLE', 'NOSCRIPT'].includes(parent.tagName)) continue;
+    for (const text of [node.nodeValue, parent.innerText || '']) {
+        const match = text.match(pattern);
+        if (match) return (match[1] || match[2]).replace(/,/g, '');
+    }
+}
+return null;
+"""
+
+BALANCE_API_PATHS = [p.strip() for p in os.getenv('LEAFLOW_BALANCE_API', '/api/user/balance').split(',') if p.strip()]
+_missing_balance_apis = set()
+
+
+def extract_balance(text):
+    """从页面文本中提取第一个带货币符号的金额"""
+    match = BALANCE_PATTERN.search(text)
+    if match:
+        return (match.group(1) or match.group(2)).replace(',', '')
+    return None
+
+
+def fetch_balance_api(session, timeout=10):
+    """尝试JSON余额接口，返回金额字符串；接口不存在的路径在本进程内不再重试"""
+    for path in BALANCE_API_PATHS:
+        if path in _missing_balance_apis:
+            continue
+        try:
+            response = session.get(f"{LEAFLOW_URL}{path}", headers={'Accept': 'application/json'},
+                                   allow_redirects=False, timeout=timeout)
+        except requests.RequestException as e:
+            logger.debug(f"余额接口 {path} 请求失败: {e}")
+            continue
+        if response.status_code in (404, 405):
+            _missing_balance_apis.add(path)
+            continue
+        if response.status_code != 200:
+            continue
+        try:
+            payload = response.json()
+        except ValueError:
+            _missing_balance_apis.add(path)
+            continue
+        data = payload.get('data', payload) if isinstance(payload, dict) else {}
+        for key in ('balance', 'money', 'amount'):
+            value = data.get(key) if isinstance(data, dict) else None
+            if value is not None:
+                return str(value)
+    return None
+
+
+class LeaflowHttpClient:
+    """不启动浏览器，直接通过HTTP完成登录、签到和余额查询"""
+    
+    CHALLENGE_MARKERS = ('captcha', 'g-recaptcha', 'h-captcha', 'cf-turnstile', 'challenge-platform', 'cf-chl')
+    RESULT_KEYWORDS = ["成功", "获得", "恭喜", "已签到", "连续签到", "完成"]
+    
+    def __init__(self, email, password, timeout=15):
+        self.email = email
+        self.password = password
+        self.timeout = timeout
+        self.session = create_http_session()
+    
+    def close(self):
+        self.session.close()
+    
+    def _check_challenge(self, response):
+        """识别验证码/人机验证页面"""
+        body = response.text[:200000].lower() if response.text else ''
+        if response.status_code in (403, 503) and ('cf-ray' in response.headers or 'cloudflare' in body):
+            raise HttpChallengeError(f"Cloudflare挑战 (HTTP {response.status_code})")
+        for marker in self.CHALLENGE_MARKERS:
+            if marker in body:
+                raise HttpChallengeError(f"页面包含人机验证: {marker}")
+        if response.status_code == 429:
+            raise HttpThrottledError("请求过于频繁 (HTTP 429)", parse_retry_after(response.headers.get('Retry-After')))
+        if response.status_code >= 500:
+            raise HttpTransientError(f"服务端错误 (HTTP {response.status_code})")
+    
+    def is_logged_in(self):
+        """带cookie访问仪表板，未被重定向到登录页即视为已登录"""
+        response = self.session.get(f"{LEAFLOW_URL}/dashboard", allow_redirects=False, timeout=self.timeout)
+        if response.status_code == 429 or response.status_code >= 500:
+            self._check_challenge(response)
+        return response.status_code == 200 and 'login' not in response.headers.get('Location', '')
+    
+    def login(self):
+        """提交登录表单（自动携带csrf token）"""
+        logger.info("HTTP登录...")
+        response = self.session.get(f"{LEAFLOW_URL}/login", timeout=self.timeout)
+        self._check_challenge(response)
+        page = parse_page(response.text)
+        
+        form = next((f for f in page.forms if any(field['type'] == 'password' for field in f['fields'])), None)
+        if form is None:
+            raise HttpChallengeError("登录页没有可提交的表单（可能由前端渲染）")
+        fields = self.login_fields(form)
+        if fields is None:
+            raise HttpChallengeError("无法识别登录表单的邮箱/密码字段")
+        email_field, password_field, remember_field = fields
+        token = page.meta.get('csrf-token') or form['inputs'].get('_token')
+        
+        data = dict(form['inputs'])
+        data.update({email_field: self.email, password_field: self.password})
+        if remember_field:
+            data[remember_field] = 'on'
+        if token:
+            data['_token'] = token
+        action = urljoin(response.url, form['action']) if form['action'] else response.url
+        
+        headers = {'Referer': response.url}
+        if token:
+            headers['X-CSRF-TOKEN'] = token
+        xsrf = self.session.cookies.get('XSRF-TOKEN')
+        if xsrf:
+            headers['X-XSRF-TOKEN'] = unquote(xsrf)
+        
+        result = self.session.post(action, data=data, headers=headers, allow_redirects=False, timeout=self.timeout)
+        location = result.headers.get('Location', '')
+        if result.status_code in (301, 302, 303) and 'login' not in location:
+            logger.info("✅ HTTP登录成功")
+            return True
+        if result.status_code == 422 or (result.status_code in (301, 302, 303) and 'login' in location):
+            # 被重定向回登录页或表单校验失败，确认是否为验证码导致
+            retry = self.session.get(urljoin(action, location) if location else action, timeout=self.timeout)
+            self._check_challenge(retry)
+            raise LoginFailedError("登录失败: 账号或密码错误")
+        self._check_challenge(result)
+        raise HttpChallengeError(f"无法识别的登录响应 (HTTP {result.status_code})")
+    
+    EMAIL_FIELD_NAMES = ('email', 'username', 'login', 'account', 'user', 'identifier')
+    
+    @classmethod
+    def login_fields(cls, form):
+        """按输入框类型和名称找出 (邮箱字段, 密码字段, 记住我字段)，无法确定时返回None"""
+        fields = form['fields']
+        passwords = [f['name'] for f in fields if f['type'] == 'password']
+        if len(passwords) != 1:
+            return None
+        candidates = [f for f in fields if f['type'] in ('email', 'text', 'tel')]
+        email = next((f['name'] for f in candidates if f['type'] == 'email'), None)
+        if email is None:
+            for name in cls.EMAIL_FIELD_NAMES:
+                email = next((f['name'] for f in candidates if name in f['name'].lower()), None)
+                if email:
+                    break
+        if email is None:
+            email = next((f['name'] for f in candidates if '邮箱' in f['placeholder'] or 'email' in f['placeholder'].lower()), None)
+        if email is None and len(candidates) == 1:
+            email = candidates[0]['name']
+        if email is None:
+            return None
+        remember = next((f['name'] for f in fields if f['type'] == 'checkbox' and 'remember' in f['name'].lower()), None)
+        return email, passwords[0], remember
+    
+    def checkin(self):
+        """访问签到页面，已签到直接返回，否则提交签到表单"""
+        logger.info("HTTP签到...")
+        response = self.session.get(CHECKIN_URL, timeout=self.timeout)
+        self._check_challenge(response)
+        if 'login' in response.url or 'oauth' in response.url:
+            raise HttpChallengeError(f"签到页面跳转到授权页: {response.url}")
+        
+        page = parse_page(response.text)
+        for form in page.forms:
+            for button in form['buttons']:
+                if '已签到' in button['text'] or '已完成' in button['text']:
+                    logger.info("今日已经签到过了！")
+                    return "今日已签到"
+        
+        form = next((f for f in page.forms
+                     if 'checkin' in f['action'] or any('签到' in b['text'] for b in f['buttons'])), None)
+        if form is None:
+            if '已签到' in page.text:
+                return "今日已签到"
+            raise HttpChallengeError("签到页面没有可提交的表单（可能由前端渲染）")
+        
+        data = dict(form['inputs'])
+        token = page.meta.get('csrf-token') or data.get('_token')
+        headers = {'Referer': response.url}
+        if token:
+            data['_token'] = token
+            headers['X-CSRF-TOKEN'] = token
+        action = urljoin(response.url, form['action']) if form['action'] else response.url
+        
+        result = self.session.post(action, data=data, headers=headers, timeout=self.timeout)
+        self._check_challenge(result)
+        if result.status_code >= 400:
+            raise HttpChallengeError(f"签到提交失败 (HTTP {result.status_code})")
+        
+        # 只有明确确认成功的结果才返回；无法确认时交给浏览器路径判断
+        try:
+            payload = result.json()
+        except ValueError:
+            payload = None
+        if payload is not None:
+            if not is_checkin_payload(payload):
+                raise HttpChallengeError(f"签到接口未确认成功: {str(payload)[:100]}")
+            return str(payload.get('message') or payload.get('msg') or "签到成功")
+        
+        text = parse_page(result.text).text
+        for keyword in self.RESULT_KEYWORDS:
+            for line in text.split('\n'):
+                if keyword in line and len(line) < 100 and not CHECKIN_FAILURE_PATTERN.search(line):
+                    return line
+        raise HttpChallengeError("签到提交后页面没有确认成功的结果")
+    
+    def get_balance(self):
+        """优先使用JSON余额接口，否则从仪表板HTML中解析余额"""
+        try:
+            balance = fetch_balance_api(self.session, self.timeout)
+            if balance:
+                logger.info(f"找到余额: {balance}元")
+                return f"{balance}元"
+            response = self.session.get(f"{LEAFLOW_URL}/dashboard", timeout=self.timeout)
+            balance = extract_balance(parse_page(response.text).text)
+            if balance:
+                logger.info(f"找到余额: {balance}元")
+                return f"{balance}元"
+        except Exception as e:
+            logger.warning(f"HTTP获取余额时出错: {e}")
+        return "未知"
+    
+    def export_cookies(self):
+        """导出为与CDP Network.getAllCookies一致的格式，便于会话缓存"""
+        cookies = []
+        for c in self.session.cookies:
+            cookies.append({
+                'name': c.name,
+                'value': c.value,
+                'domain': c.domain,
+                'path': c.path,
+                'secure': bool(c.secure),
+                'httpOnly': c.has_nonstandard_attr('HttpOnly'),
+                'expires': c.expires if c.expires else -1,
+            })
+        return cookies
+
+
+# 各步骤等待条件的最长时间（秒），可通过 LEAFLOW_WAIT_BUDGETS="login_redirect=15,checkin_result=5" 覆盖
+DEFAULT_WAIT_BUDGETS = {
+    'page_load': 20,        # driver.get 之后 document.readyState == complete
+    'dom_settle': 3,        # 动态内容渲染稳定
+    'popup': 3,             # 初始弹窗出现
+    'popup_close': 2,       # 弹窗消失
+    'login_form': 10,       # 登录输入框/按钮可点击
+    'login_redirect': 20,   # 登录后跳转
+    'checkin_page': 30,     # 签到页就绪
+    'checkin_probe': 10,    # 单次探测轮询签到元素
+    'checkin_result': 8,    # 点击后结果出现
+    'checkin_toast': 1,     # 按钮状态已变化后继续等待提示消息
+    'balance': 10,          # 仪表板余额渲染
+}
+
+
+class StepWaiter:
+    """条件驱动的等待：每一步等待具体的DOM条件，受各自的时间预算约束，并统计实际等待耗时"""
+    
+    def __init__(self, budgets=None):
+        self.budgets = dict(DEFAULT_WAIT_BUDGETS)
+        self.budgets.update(budgets or self.load_budgets())
+        self.spent = {}
+        self.timeouts = {}
+    
+    @staticmethod
+    def load_budgets():
+        budgets = {}
+        for item in os.getenv('LEAFLOW_WAIT_BUDGETS', '').split(','):
+            if '=' not in item:
+                continue
+            step, value = item.split('=', 1)
+            try:
+                budgets[step.strip()] = float(value)
+            except ValueError:
+                logger.warning(f"⚠️ 等待预算格式错误: {item}")
+        return budgets
+    
+    def budget(self, step):
+        return self.budgets.get(step, 10)
+    
+    def until(self, driver, step, condition, timeout=None, poll=0.2):
+        """等待条件成立，超过预算抛出TimeoutException"""
+        start = time.monotonic()
+        try:
+            return WebDriverWait(driver, timeout if timeout is not None else self.budget(step),
+                                 poll_frequency=poll).until(condition)
+        except selenium_timeout():
+            self.timeouts[step] = self.timeouts.get(step, 0) + 1
+            raise
+        finally:
+            self.spent[step] = self.spent.get(step, 0) + time.monotonic() - start
+    
+    def quietly(self, driver, step, condition, timeout=None, poll=0.2):
+        """同 until，但超时返回None而不是抛异常"""
+        try:
+            return self.until(driver, step, condition, timeout, poll)
+        except selenium_timeout():
+            return None
+    
+    def script(self, driver, step, script, *args, timeout=None):
+        """在页面内等待：异步脚本的第一个参数为预算（毫秒），由脚本自行在事件发生或预算用完时回调。
+        返回脚本结果，脚本返回null时计为一次超时"""
+        budget = timeout if timeout is not None else self.budget(step)
+        start = time.monotonic()
+        try:
+            # 驱动端超时留出余量，正常情况下总是由脚本先返回
+            driver.set_script_timeout(budget + 5)
+            result = driver.execute_async_script(script, int(budget * 1000), *args)
+            if result is None:
+                self.timeouts[step] = self.timeouts.get(step, 0) + 1
+            return result
+        finally:
+            self.spent[step] = self.spent.get(step, 0) + time.monotonic() - start
+    
+    @property
+    def total(self):
+        return sum(self.spent.values())
+    
+    def report(self):
+        if not self.spent:
+            return
+        details = ', '.join(f"{step}={seconds:.1f}s" + (f"(超时{self.timeouts[step]})" if step in self.timeouts else '')
+                            for step, seconds in sorted(self.spent.items(), key=lambda kv: -kv[1]))
+        logger.info(f"⏱️ 等待耗时 {self.total:.1f}s: {details}")
+
+
+def document_ready(driver):
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+def dom_settled():
+    """DOM在两次轮询之间不再变化时成立（替代固定的sleep等待动态内容）"""
+    state = {'last': None}
+    
+    def condition(driver):
+        size = driver.execute_script(
+            "return document.body ? document.body.getElementsByTagName('*').length + ':' + document.body.innerText.length : null"
+        )
+        settled = size is not None and size == state['last']
+        state['last'] = size
+        return settled
+    return condition
+
+
+class SelectorStats:
+    """记录每组选择器的命中情况，按近期成功率重排选择器顺序；分数按半衰期衰减，长期不命中的条目会被清理"""
+    
+    def __init__(self, path=None, half_life_days=None):
+        self.path = path or os.path.join(STATE_DIR, 'selector_stats.json')
+        self.half_life = float(half_life_days or env_number('LEAFLOW_SELECTOR_HALF_LIFE_DAYS', 7.0)) * 86400
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.data = self._load()
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"选择器统计文件无法读取，重新开始统计: {e}")
+            return {}
+    
+    def _score(self, entry, now):
+        age = max(0.0, now - entry.get('updated', now))
+        return entry.get('score', 0.0) * 0.5 ** (age / self.half_life)
+    
+    def score(self, group, selector):
+        with self.lock:
+            entry = self.data.get(group, {}).get(selector)
+            return self._score(entry, time.time()) if entry else 0.0
+    
+    def order(self, group, selectors):
+        """按衰减后的分数降序排列，分数相同保持原顺序"""
+        now = time.time()
+        with self.lock:
+            entries = self.data.get(group, {})
+            scores = [self._score(entries[sel], now) if sel in entries else 0.0 for _, sel in selectors]
+        ranked = sorted(range(len(selectors)), key=lambda i: (-scores[i], i))
+        return [selectors[i] for i in ranked]
+    
+    def is_known(self, group, selector):
+        return self.score(group, selector) >= 0.5
+    
+    def _update(self, group, selector, delta, create):
+        now = time.time()
+        with self.lock:
+            entries = self.data.setdefault(group, {})
+            entry = entries.get(selector)
+            if entry is None and not create:
+                return
+            score = self._score(entry, now) if entry else 0.0
+            entries[selector] = {'score': max(0.0, score + delta), 'updated': now}
+            self.dirty = True
+    
+    def record_hit(self, group, selector):
+        self._update(group, selector, 1.0, create=True)
+    
+    def record_miss(self, group, selector):
+        """只惩罚已有记录的选择器，未命中过的不建条目"""
+        self._update(group, selector, -0.5, create=False)
+    
+    def save(self):
+        """写回磁盘，同时清理分数已衰减到可以忽略的条目"""
+        with self.lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            pruned = {}
+            for group, entries in self.data.items():
+                kept = {sel: e for sel, e in entries.items() if self._score(e, now) >= 0.05}
+                if kept:
+                    pruned[group] = kept
+            self.data = pruned
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(pruned, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+            except OSError as e:
+                logger.warning(f"保存选择器统计失败: {e}")
+
+
+CHECKIN_SUCCESS_MARKERS = ('签到成功', '已签到', '已经签到', '今日已签')
+# 先于成功短语检查：“未签到”“签到失败”“not checked in”“unsuccessful”都不能算成功
+CHECKIN_FAILURE_PATTERN = re.compile(r'未|失败|没有|不能|无法|错误|异常|\bnot\b|\bun[a-z]+|fail|error|invalid', re.I)
+
+
+def is_checkin_message(message):
+    """一段签到结果文字是否明确表示签到成功或今日已签到"""
+    message = str(message or '')
+    if CHECKIN_FAILURE_PATTERN.search(message):
+        return False
+    return any(marker in message for marker in CHECKIN_SUCCESS_MARKERS)
+
+
+def is_checkin_payload(result):
+    """签到接口的JSON响应是否明确表示签到成功或今日已签到；status 只用来否决，不单独作为成功依据"""
+    if not isinstance(result, dict):
+        return False
+    if isinstance(result.get('success'), bool):
+        return result['success']
+    if CHECKIN_FAILURE_PATTERN.search(str(result.get('status', ''))):
+        return False
+    return is_checkin_message(result.get('message') or result.get('msg'))
+
+
+class EndpointCache:
+    """持久化探测到的可用API端点，带TTL；端点失败时立即失效，下次重新探测"""
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(STATE_DIR, 'endpoints.json')
+        self.ttl = env_number('LEAFLOW_ENDPOINT_TTL_HOURS', 72.0) * 3600
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+    
+    def get(self, name):
+        with self.lock:
+            entry = self.data.get(name)
+            if entry and entry.get('expires_at', 0) > time.time():
+                return entry.get('url')
+        return None
+    
+    def set(self, name, url):
+        with self.lock:
+            self.data[name] = {'url': url, 'expires_at': time.time() + self.ttl}
+            self._save()
+    
+    def invalidate(self, name):
+        with self.lock:
+            if self.data.pop(name, None) is not None:
+                self._save()
+    
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存API端点缓存失败: {e}")
+
+
+_endpoint_cache = None
+_selector_stats = None
+_state_lock = threading.Lock()
+
+
+def get_endpoint_cache():
+    """进程内共享的API端点缓存"""
+    global _endpoint_cache
+    with _state_lock:
+        if _endpoint_cache is None:
+            _endpoint_cache = EndpointCache()
+        return _endpoint_cache
+
+
+def get_selector_stats():
+    """进程内共享的选择器统计（并发工作线程共用）"""
+    global _selector_stats
+    with _state_lock:
+        if _selector_stats is None:
+            _selector_stats = SelectorStats()
+        return _selector_stats
+
+
+# 一次 execute_script 评估全部候选选择器（含同源iframe），按候选顺序返回第一个可见匹配
+PROBE_SCRIPT = r"""
+const candidates = arguments[0], framesOnly = arguments[1];
+const docs = framesOnly ? [] : [{doc: document, frame: null}];
+const crossOrigin = [];
+document.querySelectorAll('iframe, frame').forEach(f => {
+    let doc = null;
+    try { doc = f.contentDocument; } catch (e) {}
+    if (doc && doc.documentElement) docs.push({doc: doc, frame: f}); else crossOrigin.push(f);
+});
+const visible = el => {
+    const rect = el.getBoundingClientRect();
+    const style = el.ownerDocument.defaultView.getComputedStyle(el);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+};
+for (let i = 0; i < candidates.length; i++) {
+    const kind = candidates[i][0], selector = candidates[i][1];
+    for (const entry of docs) {
+        let nodes = [];
+        try {
+            if (kind === 'xpath') {
+                const snap = entry.doc.evaluate(selector, entry.doc, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                for (let k = 0; k < snap.snapshotLength; k++) nodes.push(snap.snapshotItem(k));
+            } else {
+                nodes = Array.from(entry.doc.querySelectorAll(selector));
+            }
+        } catch (e) { continue; }
+        for (const el of nodes) {
+            if (el.nodeType !== 1 || !visible(el)) continue;
+            return {
+                index: i,
+                frame: entry.frame,
+                element: entry.frame ? null : el,
+                text: (el.innerText || el.value || '').trim().slice(0, 200),
+                enabled: !el.disabled && el.getAttribute('aria-disabled') !== 'true'
+            };
+        }
+    }
+}
+return {index: -1, crossOrigin: crossOrigin};
+"""
+
+POPUP_SELECTORS = "[role='dialog'], .modal.show, .modal[style*='display: block'], .el-dialog__wrapper, .ant-modal-wrap, .swal2-container, [class*='popup']"
+
+# 点击签到按钮前注入：MutationObserver 记录新出现的提示消息（toast/弹窗/alert）和按钮状态变化，
+# 短暂出现又消失的提示也会被记下。arguments: [结果选择器列表, 签到按钮元素]
+CHECKIN_OBSERVER_SCRIPT = r"""
+const selectors = arguments[0], button = arguments[1];
+const previous = window.__leaflowCheckin;
+if (previous) previous.observer.disconnect();
+const textOf = el => {
+    if (!el.isConnected) return '';
+    const style = el.ownerDocument.defaultView.getComputedStyle(el);
+    if (style.display === 'none' || style.visibility === 'hidden') return '';
+    return (el.innerText || el.textContent || '').trim();
+};
+const matches = () => {
+    const found = [];
+    for (const s of selectors) {
+        try { document.querySelectorAll(s).forEach(el => found.push(el)); } catch (e) {}
+    }
+    return found;
+};
+// 点击前已经存在的文本不算结果
+const baseline = new Set(matches().map(textOf).filter(Boolean));
+const state = {events: [], listeners: [], observer: null};
+const emit = event => {
+    state.events.push(event);
+    state.listeners.forEach(listener => listener(event));
+};
+let buttonChanged = false;
+const scan = () => {
+    for (const el of matches()) {
+        const text = textOf(el);
+        if (text && !baseline.has(text) && !state.events.some(e => e.text === text)) {
+            emit({kind: 'message', text: text.slice(0, 200)});
+            break;
+        }
+    }
+    if (!buttonChanged && button && (!button.isConnected || button.disabled ||
+            /已签到|已完成/.test(button.innerText || '') || String(button.className).includes('disabled'))) {
+        buttonChanged = true;
+        emit({kind: 'button', text: button.isConnected ? (button.innerText || '').trim().slice(0, 200) : ''});
+    }
+};
+state.observer = new MutationObserver(scan);
+state.observer.observe(document.documentElement, {
+    childList: true, subtree: true, characterData: true,
+    attributes: true, attributeFilter: ['class', 'style', 'disabled', 'hidden', 'aria-hidden']
+});
+window.__leaflowCheckin = state;
+"""
+
+# 点击后一次异步脚本等待观察器的第一个有效变化：出现提示消息立即返回；只有按钮状态变化时
+# 再等待 grace 毫秒看是否还有提示消息；预算内没有任何变化时返回null。
+# 页面中没有观察器（点击后已整页跳转）时返回 {kind: 'missing'}
+CHECKIN_RESULT_WAIT_SCRIPT = r"""
+const timeout = arguments[0], grace = arguments[1], done = arguments[arguments.length - 1];
+const state = window.__leaflowCheckin;
+if (!state) { done({kind: 'missing'}); return; }
+const first = kind => state.events.find(e => e.kind === kind) || null;
+let finished = false, graceTimer = null;
+const finish = value => {
+    if (finished) return;
+    finished = true;
+    state.observer.disconnect();
+    done(value);
+};
+const onEvent = event => {
+    if (event.kind === 'message') finish(event);
+    else if (graceTimer === null) graceTimer = setTimeout(() => finish(first('message') || event), grace);
+};
+state.events.forEach(onEvent);
+state.listeners.push(onEvent);
+setTimeout(() => finish(first('message') || first('button')), timeout);
+"""
+
+# 观察器不可用时的兜底：一次往返读取结果提示、页面关键词行或按钮状态
+CHECKIN_RESULT_SCAN_SCRIPT = r"""
+const selectors = arguments[0], keywords = arguments[1];
+for (const s of selectors) {
+    for (const el of document.querySelectorAll(s)) {
+        const text = el.offsetParent !== null ? (el.innerText || '').trim() : '';
+        if (text) return {kind: 'message', text: text};
+    }
+}
+const lines = (document.body ? document.body.innerText : '').split('\n').map(l => l.trim());
+for (const keyword of keywords) {
+    const line = lines.find(l => l.includes(keyword) && l.length < 100);
+    if (line) return {kind: 'page', text: line};
+}
+const btn = document.querySelector('button.checkin-btn');
+if (btn && (btn.disabled || btn.innerText.includes('已签到') || btn.className.includes('disabled'))) return {kind: 'button', text: ''};
+return null;
+"""
+
+
+# 资源拦截：按类别屏蔽与登录/签到流程无关的请求。
+# 文档、脚本、样式和XHR始终放行；人机验证服务（Cloudflare、reCAPTCHA、hCaptcha）不在屏蔽列表中
+BLOCK_PATTERNS = {
+    'images': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.ico', '*.bmp'],
+    'fonts': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*fonts.googleapis.com*', '*fonts.gstatic.com*'],
+    'media': ['*.mp4', '*.webm', '*.mp3', '*.ogg', '*.wav', '*.m4a'],
+    'analytics': [
+        '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*hm.baidu.com*',
+        '*clarity.ms*', '*hotjar.com*', '*cloudflareinsights.com*', '*facebook.net*', '*sentry.io*',
+        '*plausible.io*', '*umami.is*', '*cnzz.com*', '*51.la*',
+    ],
+}
+
+
+def resource_block_categories():
+    """读取 LEAFLOW_BLOCK_RESOURCES：留空时无头环境默认全部开启，0 关闭，或逗号分隔的类别"""
+    value = os.getenv('LEAFLOW_BLOCK_RESOURCES', '').strip().lower()
+    if not value:
+        return list(BLOCK_PATTERNS) if os.getenv('GITHUB_ACTIONS') else []
+    if value in ('0', 'false', 'off', 'none'):
+        return []
+    if value in ('1', 'true', 'on', 'all'):
+        return list(BLOCK_PATTERNS)
+    return [c.strip() for c in value.split(',') if c.strip() in BLOCK_PATTERNS]
+
+
+def apply_resource_blocking(driver, categories, quiet=False):
+    """通过CDP Network.setBlockedURLs 屏蔽资源，设置在当前标签页上，跨导航保持有效；可随时用新的规则替换。
+    setBlockedURLs 只有屏蔽规则，无法按资源类型放行，因此用扩展名和统计域名列出要屏蔽的资源：
+    文档、脚本、样式表和 XHR/Fetch 都不会被匹配；登录页的验证码图片由 login() 临时放行"""
+    patterns = []
+    for category in categories:
+        patterns.extend(BLOCK_PATTERNS[category])
+    patterns.extend(p.strip() for p in os.getenv('LEAFLOW_BLOCK_EXTRA', '').split(',') if p.strip())
+    # quiet 用于替换已有规则，规则为空时也要提交以清除之前的规则
+    if not patterns and not quiet:
+        return
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+        if not quiet:
+            logger.info(f"🚫 已开启资源拦截: {', '.join(categories)} ({len(patterns)} 条规则)")
+    except Exception as e:
+        logger.warning(f"开启资源拦截失败: {e}")
+
+
+def page_transfer_bytes(driver):
+    """读取当前页面通过 Resource Timing 统计的传输字节数"""
+    return driver.execute_script("""
+        const nav = performance.getEntriesByType('navigation')[0];
+        const resources = performance.getEntriesByType('resource');
+        return {
+            document: nav ? nav.transferSize : 0,
+            resources: resources.reduce((sum, r) => sum + (r.transferSize || 0), 0),
+            count: resources.length
+        };
+    """)
+
+
+def percentile(values, q):
+    """最近秩法分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(-(-q * len(ordered) // 1)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class RunMetrics:
+    """记录每个账号每个阶段的耗时span，运行结束后导出JSON报告和Prometheus textfile"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.spans = []
+        self.accounts = {}
+    
+    @contextlib.contextmanager
+    def span(self, account, phase, engine='browser'):
+        record = {
+            'account': account_label(account) if account else '-',
+            'phase': phase,
+            'engine': engine,
+            'start': round(time.time() - self.started_at, 3),
+            'attempts': 1,
+            'outcome': 'ok',
+        }
+        start = time.monotonic()
+        try:
+            yield record
+        except Exception:
+            record['outcome'] = 'error'
+            raise
+        finally:
+            record['duration'] = round(time.monotonic() - start, 3)
+            with self.lock:
+                self.spans.append(record)
+    
+    def reset(self):
+        """清空已记录的数据（守护进程每天导出后调用，避免无限增长）"""
+        with self.lock:
+            self.started_at = time.time()
+            self.spans = []
+            self.accounts = {}
+    
+    def annotate(self, account, **fields):
+        """附加账号级别的信息（结果、等待耗时、传输字节等）"""
+        with self.lock:
+            self.accounts.setdefault(account_label(account), {}).update(fields)
+    
+    def phase_stats(self):
+        grouped = {}
+        with self.lock:
+            for span in self.spans:
+                grouped.setdefault((span['phase'], span['engine']), []).append(span)
+        stats = {}
+        for key, spans in sorted(grouped.items()):
+            durations = [s['duration'] for s in spans]
+            outcomes = {}
+            for s in spans:
+                outcomes[s['outcome']] = outcomes.get(s['outcome'], 0) + 1
+            stats[key] = {
+                'count': len(spans),
+                'sum': sum(durations),
+                'p50': percentile(durations, 0.5),
+                'p95': percentile(durations, 0.95),
+                'max': max(durations),
+                'attempts': sum(s['attempts'] for s in spans),
+                'outcomes': outcomes,
+            }
+        return stats
+    
+    def log_summary(self):
+        for (phase, engine), st in self.phase_stats().items():
+            logger.info(f"⏱️ {engine}/{phase}: n={st['count']} p50={st['p50']:.2f}s p95={st['p95']:.2f}s max={st['max']:.2f}s")
+    
+    def to_dict(self):
+        with self.lock:
+            spans = list(self.spans)
+            accounts = dict(self.accounts)
+        return {
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+            'duration': round(time.time() - self.started_at, 3),
+            'startup': get_startup_profile().to_dict(),
+            'memory': self.memory_summary(accounts),
+            'phases': [dict(phase=phase, engine=engine, **st) for (phase, engine), st in self.phase_stats().items()],
+            'accounts': accounts,
+            'spans': spans,
+        }
+    
+    @staticmethod
+    def memory_summary(accounts):
+        """本次运行的内存峰值：整个进程树，以及单个浏览器进程树的最大值"""
+        browser_peaks = [a['browser_rss_peak_mb'] for a in accounts.values() if 'browser_rss_peak_mb' in a]
+        return {
+            'peak_rss_mb': round(get_memory_monitor().peak_total / 1024 / 1024, 1),
+            'browser_peak_rss_mb': max(browser_peaks) if browser_peaks else None,
+        }
+    
+    def log_memory(self):
+        with self.lock:
+            memory = self.memory_summary(dict(self.accounts))
+        if memory['peak_rss_mb']:
+            browser = f"，单个浏览器最高 {memory['browser_peak_rss_mb']} MB" if memory['browser_peak_rss_mb'] else ""
+            logger.info(f"🧠 内存峰值: 进程树合计 {memory['peak_rss_mb']} MB{browser}")
+    
+    def to_prometheus(self):
+        lines = [
+            '# HELP leaflow_phase_duration_seconds Duration of check-in phases in the last run.',
+            '# TYPE leaflow_phase_duration_seconds summary',
+        ]
+        stats = self.phase_stats()
+        for (phase, engine), st in stats.items():
+            labels = f'phase="{phase}",engine="{engine}"'
+            lines.append(f'leaflow_phase_duration_seconds{{{labels},quantile="0.5"}} {st["p50"]:.3f}')
+            lines.append(f'leaflow_phase_duration_seconds{{{labels},quantile="0.95"}} {st["p95"]:.3f}')
+            lines.append(f'leaflow_phase_duration_seconds_sum{{{labels}}} {st["sum"]:.3f}')
+            lines.append(f'leaflow_phase_duration_seconds_count{{{labels}}} {st["count"]}')
+        lines += [
+            '# HELP leaflow_phase_outcomes_total Phase outcomes in the last run.',
+            '# TYPE leaflow_phase_outcomes_total counter',
+        ]
+        for (phase, engine), st in stats.items():
+            for outcome, count in sorted(st['outcomes'].items()):
+                lines.append(f'leaflow_phase_outcomes_total{{phase="{phase}",engine="{engine}",outcome="{outcome}"}} {count}')
+        with self.lock:
+            results = [a.get('success') for a in self.accounts.values() if 'success' in a]
+        lines += [
+            '# HELP leaflow_run_accounts Accounts processed in the last run by result.',
+            '# TYPE leaflow_run_accounts gauge',
+            f'leaflow_run_accounts{{result="success"}} {sum(1 for r in results if r)}',
+            f'leaflow_run_accounts{{result="failure"}} {sum(1 for r in results if not r)}',
+            '# HELP leaflow_run_duration_seconds Wall-clock duration of the last run.',
+            '# TYPE leaflow_run_duration_seconds gauge',
+            f'leaflow_run_duration_seconds {time.time() - self.started_at:.3f}',
+            '# HELP leaflow_peak_rss_bytes Peak resident memory of the whole process tree during the last run.',
+            '# TYPE leaflow_peak_rss_bytes gauge',
+            f'leaflow_peak_rss_bytes {get_memory_monitor().peak_total}',
+            '# HELP leaflow_startup_seconds Seconds from process start to each startup milestone.',
+            '# TYPE leaflow_startup_seconds gauge',
+        ]
+        for stage, value in sorted(get_startup_profile().to_dict()['stages'].items()):
+            lines.append(f'leaflow_startup_seconds{{stage="{stage}"}} {value:.4f}')
+        lines += [
+            '# HELP leaflow_run_timestamp_seconds Unix time the last run finished.',
+            '# TYPE leaflow_run_timestamp_seconds gauge',
+            f'leaflow_run_timestamp_seconds {time.time():.0f}',
+        ]
+        return '\n'.join(lines) + '\n'
+    
+    def export(self):
+        """写出 LEAFLOW_METRICS_JSON 和 LEAFLOW_METRICS_PROM（原子替换，适配node_exporter textfile采集）"""
+        metrics_dir = os.path.join(STATE_DIR, 'metrics')
+        json_path = os.getenv('LEAFLOW_METRICS_JSON') or os.path.join(metrics_dir, 'last_run.json')
+        prom_path = os.getenv('LEAFLOW_METRICS_PROM') or os.path.join(metrics_dir, 'leaflow_checkin.prom')
+        for path, content in ((json_path, json.dumps(self.to_dict(), ensure_ascii=False, indent=1)),
+                              (prom_path, self.to_prometheus())):
+            try:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"写出耗时报告失败 {path}: {e}")
+        logger.info(f"📈 耗时报告已写出: {json_path}, {prom_path}")
+
+
+_run_metrics = RunMetrics()
+
+
+def get_run_metrics():
+    return _run_metrics
+
+
+def timed_phase(phase, failed=lambda result: result is False):
+    """把方法调用记录为当前账号的一个阶段span；方法内可通过 self.span_note 补充尝试次数等信息"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with get_run_metrics().span(self.email, phase) as record:
+                self._span_stack.append(record)
+                try:
+                    result = func(self, *args, **kwargs)
+                finally:
+                    self._span_stack.pop()
+                if failed(result):
+                    record['outcome'] = 'fail'
+                return result
+        return wrapper
+    return decorator
+
+
+# HTTP步骤对应的阶段名
+HTTP_STEP_PHASES = {
+    'is_logged_in': 'session_restore',
+    'login': 'login',
+    'checkin': 'checkin',
+    'get_balance': 'balance_fetch',
+}
+
+
+# 一次脚本调用收集调试快照：URL、标题、源码以及前若干个按钮/链接的元数据
+DEBUG_SNAPSHOT_SCRIPT = """
+const limit = arguments[0];
+const describe = (el) => ({
+    text: (el.innerText || el.value || '').trim().slice(0, 80),
+    cls: el.getAttribute('class') || '',
+    href: el.getAttribute('href') || '',
+    visible: !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)
+});
+const buttons = document.querySelectorAll('button');
+const links = document.querySelectorAll('a');
+return {
+    url: location.href,
+    title: document.title,
+    html: document.documentElement ? document.documentElement.outerHTML : '',
+    button_count: buttons.length,
+    link_count: links.length,
+    buttons: Array.from(buttons).slice(0, limit).map(describe),
+    links: Array.from(links).slice(0, limit).map(describe)
+};
+"""
+
+
+class DebugCapture:
+    """调试现场捕获：浏览器端只做一次脚本调用和一次截图，压缩和写盘放到后台线程，目录总大小超限时删除最旧的文件"""
+    
+    MAX_HTML_BYTES = 2 * 1024 * 1024
+    
+    def __init__(self):
+        self.enabled = os.getenv('LEAFLOW_DEBUG_CAPTURE', '1').strip() != '0'
+        self.screenshots = os.getenv('LEAFLOW_DEBUG_SCREENSHOT', '1').strip() != '0'
+        self.directory = os.getenv('LEAFLOW_DEBUG_DIR') or os.path.join(STATE_DIR, 'debug')
+        self.max_bytes = int(env_number('LEAFLOW_DEBUG_MAX_MB', 20.0) * 1024 * 1024)
+        self.max_pending = max(1, env_number('LEAFLOW_DEBUG_MAX_PENDING', 4, int))
+        self.element_limit = 10
+        self.lock = threading.Lock()
+        self.pending = []
+        self.executor = None
+    
+    def capture(self, driver, name):
+        """采集调试现场并提交后台写盘，返回元数据（失败时返回None）"""
+        if not self.enabled:
+            return None
+        with self.lock:
+            self.pending = [f for f in self.pending if not f.done()]
+            if len(self.pending) >= self.max_pending:
+                logger.warning(f"调试文件写入积压，跳过本次捕获: {name}")
+                return None
+        try:
+            snapshot = driver.execute_script(DEBUG_SNAPSHOT_SCRIPT, self.element_limit) or {}
+        except Exception as e:
+            logger.error(f"调试信息捕获失败: {e}")
+            return None
+        png = None
+        if self.screenshots:
+            try:
+                png = driver.get_screenshot_as_png()
+            except Exception as e:
+                logger.debug(f"截图失败: {e}")
+        
+        logger.info(f"当前URL: {snapshot.get('url')}")
+        logger.info(f"页面标题: {snapshot.get('title')}")
+        logger.info(f"页面上找到 {snapshot.get('button_count', 0)} 个按钮, {snapshot.get('link_count', 0)} 个链接")
+        for i, btn in enumerate(snapshot.get('buttons', [])):
+            logger.info(f"按钮 {i}: 文本='{btn['text']}', class='{btn['cls']}', 可见={btn['visible']}")
+        for i, link in enumerate(snapshot.get('links', [])):
+            logger.info(f"链接 {i}: 文本='{link['text']}', href='{link['href']}'")
+        
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="debug-capture")
+            self.pending.append(self.executor.submit(self._write, name, snapshot, png))
+        return snapshot
+    
+    def _write(self, name, snapshot, png):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            base = os.path.join(self.directory, name)
+            html = (snapshot.pop('html', '') or '').encode('utf-8')[:self.MAX_HTML_BYTES]
+            with gzip.open(f"{base}.html.gz", 'wb', compresslevel=6) as f:
+                f.write(html)
+            with open(f"{base}.json", 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=1)
+            if png:
+                with open(f"{base}.png", 'wb') as f:
+                    f.write(png)
+            logger.info(f"已保存调试文件: {base}.*")
+            self._rotate()
+        except OSError as e:
+            logger.warning(f"写入调试文件失败 {name}: {e}")
+    
+    def _rotate(self):
+        """目录总大小超过上限时从最旧的文件开始删除"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+    
+    def flush(self, timeout=30):
+        """等待后台写盘完成（进程退出前调用）"""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        deadline = time.monotonic() + timeout
+        for future in pending:
+            try:
+                future.result(timeout=max(0, deadline - time.monotonic()))
+            except Exception:
+                pass
+
+
+_debug_capture = DebugCapture()
+
+
+def get_debug_capture():
+    return _debug_capture
+
+
+# 低内存模式的Chrome参数：限制渲染进程数和缓存，关闭与签到无关的后台功能
+LOW_MEMORY_ARGS = [
+    '--renderer-process-limit=2',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--no-first-run',
+    '--mute-audio',
+    '--metrics-recording-only',
+    '--disk-cache-size=33554432',
+    '--media-cache-size=1048576',
+    '--js-flags=--max-old-space-size=256',
+]
+LOW_MEMORY_DISABLED_FEATURES = ['Translate', 'OptimizationHints', 'MediaRouter', 'BackForwardCache', 'AutofillServerCommunication']
+# 关闭站点隔离能进一步减少渲染进程，但浏览器中保存着账号的登录凭据，只在 LEAFLOW_DISABLE_SITE_ISOLATION=1 时使用
+SITE_ISOLATION_OFF_ARGS = ['--disable-site-isolation-trials']
+SITE_ISOLATION_OFF_FEATURES = ['site-per-process']
+
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _scan_processes():
+    """一次扫描 /proc，返回 (父进程 -> 子进程列表, 进程 -> RSS字节)；非Linux平台返回空"""
+    children, rss = {}, {}
+    try:
+        pids = [p for p in os.listdir('/proc') if p.isdigit()]
+    except OSError:
+        return children, rss
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                fields = f.read().rsplit(b')', 1)[1].split()
+            ppid, pages = int(fields[1]), int(fields[21])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(pid))
+        rss[int(pid)] = pages * PAGE_SIZE
+    return children, rss
+
+
+def _tree_rss(root, children, rss):
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+def process_tree_rss(root_pid):
+    """进程树（含全部子孙进程）的RSS字节数，非Linux平台返回0"""
+    children, rss = _scan_processes()
+    return _tree_rss(root_pid, children, rss)
+
+
+def driver_pid(driver):
+    """chromedriver 进程号（Chrome及其渲染进程都是它的子进程）"""
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+
+class MemoryMonitor:
+    """后台线程定期扫描 /proc：记录本进程树（包含所有浏览器）的峰值RSS，以及每个被监视浏览器进程树的峰值"""
+    
+    def __init__(self):
+        self.interval = env_number('LEAFLOW_MEMORY_SAMPLE_INTERVAL', 0.5)
+        self.enabled = os.path.isdir('/proc/self') and self.interval > 0
+        self.lock = threading.Lock()
+        self.watched = {}
+        self.peak_total = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+    
+    def start(self):
+        if not self.enabled or self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        self.sample()
+    
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+    
+    def sample(self):
+        if not self.enabled:
+            return
+        children, rss = _scan_processes()
+        total = _tree_rss(os.getpid(), children, rss)
+        with self.lock:
+            self.peak_total = max(self.peak_total, total)
+            for entry in self.watched.values():
+                entry['last'] = _tree_rss(entry['pid'], children, rss)
+                entry['peak'] = max(entry['peak'], entry['last'])
+    
+    def watch(self, pid):
+        """开始监视一个浏览器进程树，返回句柄"""
+        if not self.enabled or not pid:
+            return None
+        token = object()
+        with self.lock:
+            self.watched[token] = {'pid': pid, 'peak': 0, 'last': 0}
+        return token
+    
+    def unwatch(self, token):
+        """停止监视并立即采样一次，返回 (峰值, 当前) 字节数"""
+        if token is None:
+            return None, None
+        children, rss = _scan_processes()
+        with self.lock:
+            entry = self.watched.pop(token, None)
+        if entry is None:
+            return None, None
+        current = _tree_rss(entry['pid'], children, rss)
+        return max(entry['peak'], current), current
+
+
+_memory_monitor = MemoryMonitor()
+
+
+def get_memory_monitor():
+    return _memory_monitor
+
+
+# 登录结果改由Chrome性能日志中的网络事件判断（默认开启），设为0时退回轮询当前URL
+LOGIN_NETWORK_EVENTS = os.getenv('LEAFLOW_LOGIN_EVENTS', '1').strip() != '0'
+
+# 登录被拒绝后一次往返读取页面上的错误提示和人机验证组件
+LOGIN_REJECTION_SCRIPT = r"""
+const visible = e => e.offsetParent !== null && (e.innerText || '').trim();
+const error = Array.from(document.querySelectorAll(".error, .alert-danger, [class*='error'], [class*='danger']")).find(visible);
+const captcha = document.querySelector(".g-recaptcha, .h-captcha, .cf-turnstile, iframe[src*='captcha'], iframe[src*='challenge']");
+return {error: error ? error.innerText.trim().slice(0, 200) : '', captcha: !!captcha || /captcha/i.test(location.href)};
+"""
+
+
+def is_login_url(url):
+    return 'login' in urlparse(url or '').path
+
+
+def discard_performance_log(driver):
+    """清空chromedriver缓存的性能日志，避免复用的浏览器在账号之间积累网络事件"""
+    try:
+        driver.get_log('performance')
+    except Exception:
+        pass
+
+
+class LoginNetworkWatch:
+    """从Chrome性能日志（CDP Network事件）判断登录结果。
+    
+    跟踪点击登录后的第一个登录表单POST：重定向时按跳转目标判断，否则按响应状态码判断；
+    XHR/Fetch 登录返回2xx时读取响应体（Network.getResponseBody），明确成功或失败时立即得出结果，
+    否则以随后的页面跳转为准。登录接口路径不含 login、或前端登录后只用 pushState 跳转时没有可判断的事件，
+    因此每次轮询还会检查当前URL：已离开登录页即视为成功（与只轮询URL时一样快）。
+    作为 StepWaiter 的条件使用，得到结果时返回
+    (kind, 状态码, URL)，kind 为 success / rejected / captcha / expired / throttled / server_error。
+    """
+    
+    def __init__(self, driver):
+        self.driver = driver
+        self.request_id = None
+        self.response_url = ''
+        self.ajax_pending = False
+        self.outcome = None
+    
+    @classmethod
+    def start(cls, driver):
+        """丢弃点击之前的事件后开始观察；性能日志不可用时返回None"""
+        if not LOGIN_NETWORK_EVENTS:
+            return None
+        try:
+            driver.get_log('performance')
+        except Exception as e:
+            logger.debug(f"性能日志不可用，登录结果改为轮询URL: {e}")
+            return None
+        return cls(driver)
+    
+    def __call__(self, driver):
+        for entry in driver.get_log('performance'):
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.feed(message.get('method'), message.get('params') or {})
+            if self.outcome:
+                return self.outcome
+        url = driver.current_url
+        if not is_login_url(url):
+            self.outcome = ('success', 200, url)
+        return self.outcome or False
+    
+    def feed(self, method, params):
+        if self.outcome:
+            return
+        request = params.get('request') or {}
+        if method == 'Network.requestWillBeSent':
+            if self.request_id is None:
+                if request.get('method') == 'POST' and is_login_url(request.get('url')):
+                    self.request_id = params.get('requestId')
+            elif params.get('requestId') == self.request_id and params.get('redirectResponse'):
+                self.classify(params['redirectResponse'].get('status'), request.get('url', ''))
+            elif self.ajax_pending and params.get('type') == 'Document':
+                url = request.get('url', '')
+                self.outcome = ('rejected' if is_login_url(url) else 'success', 200, url)
+        elif method == 'Network.responseReceived' and self.request_id is not None \
+                and params.get('requestId') == self.request_id:
+            response = params.get('response') or {}
+            self.response_url = response.get('url', '')
+            self.classify(response.get('status'), self.response_url, ajax=params.get('type') in ('XHR', 'Fetch'))
+        elif method == 'Network.loadingFinished' and self.ajax_pending and params.get('requestId') == self.request_id:
+            self.inspect_body()
+    
+    def inspect_body(self):
+        """读取前端登录接口的JSON响应体，success/errors 字段明确时直接得出结果"""
+        try:
+            body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': self.request_id})
+            payload = json.loads(body.get('body') or '')
+        except Exception as e:
+            logger.debug(f"读取登录响应体失败: {e}")
+            return
+        if not isinstance(payload, dict):
+            return
+        status = str(payload.get('status', '')).lower()
+        if payload.get('success') is False or payload.get('errors') or status in ('error', 'fail', 'failed'):
+            self.outcome = ('rejected', 200, self.response_url)
+        elif payload.get('success') is True:
+            self.outcome = ('success', 200, payload.get('redirect') or self.response_url)
+    
+    def classify(self, status, url, ajax=False):
+        status = int(status or 0)
+        if 300 <= status < 400:
+            # url 为重定向目标：回到登录页表示被拒绝，带验证码标记时为人机验证
+            if 'captcha' in url.lower() or 'challenge' in url.lower():
+                kind = 'captcha'
+            else:
+                kind = 'rejected' if is_login_url(url) else 'success'
+        elif 200 <= status < 300:
+            if ajax:
+                # 前端登录：等待随后的页面跳转
+                self.ajax_pending = True
+                return
+            kind = 'rejected'
+        elif status == 419:
+            kind = 'expired'
+        elif status == 429:
+            kind = 'throttled'
+        elif status == 403:
+            kind = 'captcha'
+        elif status >= 500:
+            kind = 'server_error'
+        else:
+            kind = 'rejected'
+        self.outcome = (kind, status, url)
+
+
+def create_chrome_driver():
+    """设置Chrome驱动选项并启动浏览器"""
+    chrome_options = Options()
+    block_categories = resource_block_categories()
+    
+    # GitHub Actions环境配置
+    if os.getenv('GITHUB_ACTIONS'):
+        chrome_options.add_argument('--headless')
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument('--window-size=1920,1080')
+    
+    # 低内存模式（默认开启）：单个Chrome的常驻内存显著下降，同一台机器可以并发更多浏览器
+    disabled_features = []
+    if os.getenv('LEAFLOW_LOW_MEMORY', '1').strip() != '0':
+        for arg in LOW_MEMORY_ARGS:
+            chrome_options.add_argument(arg)
+        disabled_features += LOW_MEMORY_DISABLED_FEATURES
+    if os.getenv('LEAFLOW_DISABLE_SITE_ISOLATION', '').strip() == '1':
+        for arg in SITE_ISOLATION_OFF_ARGS:
+            chrome_options.add_argument(arg)
+        disabled_features += SITE_ISOLATION_OFF_FEATURES
+    # Chrome只认最后一个 --disable-features，所有特性合并成一个参数
+    if disabled_features:
+        chrome_options.add_argument(f"--disable-features={','.join(disabled_features)}")
+    
+    # 通用配置
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    
+    # 性能日志只记录网络事件，用于判断登录结果（见 LoginNetworkWatch）
+    if LOGIN_NETWORK_EVENTS:
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+    
+    driver = webdriver.Chrome(options=chrome_options)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    apply_resource_blocking(driver, block_categories)
+    get_startup_profile().mark('first_driver')
+    return driver
+
+
+class BrowserLifecycle:
+    """在多个账号之间复用同一个Chrome进程。
+    
+    每个账号开始前清空cookies和站点存储，保证账号之间互不影响；
+    处理 LEAFLOW_BROWSER_RECYCLE 个账号后或浏览器崩溃后重新启动。
+    """
+    
+    CLEAR_ORIGINS = [LEAFLOW_URL, CHECKIN_URL]
+    
+    def __init__(self, max_accounts=None):
+        self.max_accounts = max_accounts or max(1, env_number('LEAFLOW_BROWSER_RECYCLE', 10, int))
+        self.max_rss = env_number('LEAFLOW_BROWSER_MAX_RSS_MB', 800.0) * 1024 * 1024
+        self.driver = None
+        self.uses = 0
+        self.launches = 0
+    
+    def acquire(self):
+        """返回一个状态干净的driver"""
+        if self.driver is not None:
+            if self.uses >= self.max_accounts:
+                logger.info(f"♻️ 浏览器已处理 {self.uses} 个账号，重新启动")
+                self.close()
+            elif not self._alive():
+                logger.warning("♻️ 浏览器已失去响应，重新启动")
+                self.close()
+            elif not self._reset():
+                self.close()
+        
+        if self.driver is None:
+            self.driver = create_chrome_driver()
+            self.uses = 0
+            self.launches += 1
+        
+        self.uses += 1
+        return self.driver
+    
+    def release(self, crashed=False, rss=None):
+        """账号处理结束；浏览器崩溃或进程树内存超过 LEAFLOW_BROWSER_MAX_RSS_MB 时丢弃，下次 acquire 重新启动"""
+        if crashed:
+            self.close()
+        elif rss and self.max_rss and rss > self.max_rss:
+            logger.info(f"♻️ 浏览器内存 {rss / 1024 / 1024:.0f} MB 超过上限，重新启动")
+            self.close()
+    
+    def _alive(self):
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+    
+    def _reset(self):
+        """清空上一个账号留下的cookies、存储和多余窗口"""
+        try:
+            handles = self.driver.window_handles
+            for handle in handles[1:]:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.driver.switch_to.window(handles[0])
+            self.driver.get("about:blank")
+            self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+            discard_performance_log(self.driver)
+            for origin in self.CLEAR_ORIGINS:
+                self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {
+                    'origin': origin,
+                    'storageTypes': 'cookies,local_storage,session_storage,indexeddb,websql,cache_storage,service_workers',
+                })
+            return True
+        except Exception as e:
+            logger.warning(f"清理浏览器状态失败，将重新启动: {e}")
+            return False
+    
+    def warm(self):
+        """预先启动浏览器（不计入已处理账号数），下一个账号 acquire 时无需冷启动"""
+        if self.driver is None:
+            self.driver = create_chrome_driver()
+            self.uses = 0
+            self.launches += 1
+    
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+            self.uses = 0
+
+
 class LeaflowAutoCheckin:
-    def __init__(self, email, password):
+    def __init__(self, email, password, browser=None):
         self.email = email
         self.password = password
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
@@ -32,156 +2089,167 @@ class LeaflowAutoCheckin:
         if not self.email or not self.password:
             raise ValueError("邮箱和密码不能为空")
         
+        self.session_cache = SessionCache()
+        # 默认先走HTTP路径，只有遇到无法处理的挑战时才启动浏览器
+        self.http_first = os.getenv('LEAFLOW_HTTP_FIRST', '1').strip() != '0'
+        self.waiter = StepWaiter()
+        self.page_bytes = {}
+        self._span_stack = []
+        self.dashboard_balance = None
+        self._api_session = None
+        self._memory_token = None
+        self._result_observer = False
+        # 共享的 BrowserLifecycle；为None时每个账号单独启动并关闭浏览器
+        self.browser = browser
+        # 浏览器在 run() 中第一次需要时才启动，HTTP路径完成的账号不会启动Chrome
         self.driver = None
-        self.setup_driver()
     
+    def span_note(self, **fields):
+        """更新当前阶段span的字段，例如 attempts"""
+        if self._span_stack:
+            self._span_stack[-1].update(fields)
+    
+    @timed_phase('driver_setup')
     def setup_driver(self):
-        """设置Chrome驱动选项"""
-        chrome_options = Options()
-        
-        # GitHub Actions环境配置
-        if os.getenv('GITHUB_ACTIONS'):
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--window-size=1920,1080')
-        
-        # 通用配置
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        """获取浏览器：有共享的浏览器生命周期管理器时复用，否则单独启动"""
+        if self.browser is not None:
+            self.driver = self.browser.acquire()
+        else:
+            self.driver = create_chrome_driver()
+        self._memory_token = get_memory_monitor().watch(driver_pid(self.driver))
     
-    def debug_page_state(self, filename="debug_page"):
-        """保存页面源码和截图用于调试"""
+    def record_page_bytes(self, label):
+        """记录当前页面传输的字节数，用于衡量资源拦截节省的流量"""
         try:
-            # 保存HTML源码
-            with open(f"{filename}.html", "w", encoding="utf-8") as f:
-                f.write(self.driver.page_source)
-            logger.info(f"已保存页面源码: {filename}.html")
-            
-            # 保存截图
-            self.driver.save_screenshot(f"{filename}.png")
-            logger.info(f"已保存截图: {filename}.png")
-            
-            # 记录当前URL和页面标题
-            logger.info(f"当前URL: {self.driver.current_url}")
-            logger.info(f"页面标题: {self.driver.title}")
-            
-            # 记录可见的按钮
-            buttons = self.driver.find_elements(By.TAG_NAME, "button")
-            logger.info(f"页面上找到 {len(buttons)} 个按钮")
-            for i, btn in enumerate(buttons[:10]):  # 记录前10个按钮
-                try:
-                    btn_text = btn.text.strip()
-                    btn_class = btn.get_attribute('class')
-                    btn_visible = btn.is_displayed()
-                    logger.info(f"按钮 {i}: 文本='{btn_text}', class='{btn_class}', 可见={btn_visible}")
-                except:
-                    pass
-            
-            # 记录所有链接
-            links = self.driver.find_elements(By.TAG_NAME, "a")
-            logger.info(f"页面上找到 {len(links)} 个链接")
-            for i, link in enumerate(links[:10]):
-                try:
-                    link_text = link.text.strip()
-                    link_href = link.get_attribute('href')
-                    logger.info(f"链接 {i}: 文本='{link_text}', href='{link_href}'")
-                except:
-                    pass
-                    
+            stats = page_transfer_bytes(self.driver)
         except Exception as e:
-            logger.error(f"调试信息捕获失败: {e}")
+            logger.debug(f"读取页面传输字节失败: {e}")
+            return
+        total = (stats.get('document') or 0) + (stats.get('resources') or 0)
+        self.page_bytes[label] = total
+        logger.info(f"📦 {label} 页面传输 {total / 1024:.1f} KB（{stats.get('count', 0)} 个子资源）")
+    
+    def navigate(self, url=None):
+        """受主机限速约束的页面导航；url为空时刷新当前页面"""
+        host = urlparse(url or self.driver.current_url).hostname
+        get_rate_limiter().acquire(host)
+        get_startup_profile().mark('first_request')
+        if url:
+            self.driver.get(url)
+        else:
+            self.driver.refresh()
+    
+    def debug_page_state(self, filename="debug_page"):
+        """保存页面源码、截图和按钮/链接元数据用于调试（写盘在后台线程完成）"""
+        get_debug_capture().capture(self.driver, f"{filename}_{account_key(self.email)[:6]}")
     
     def wait_for_page_ready(self, timeout=30):
         """等待页面完全加载，包括JavaScript"""
         try:
             # 等待document.readyState变为complete
-            WebDriverWait(self.driver, timeout).until(
-                lambda driver: driver.execute_script("return document.readyState") == "complete"
-            )
+            self.waiter.until(self.driver, 'page_load', document_ready, timeout=timeout)
             logger.info("页面加载状态: complete")
             
-            # 如果页面使用jQuery，等待它完成（可选）
-            try:
-                WebDriverWait(self.driver, 5).until(
-                    lambda driver: driver.execute_script("return typeof jQuery != 'undefined' && jQuery.active == 0")
-                )
-                logger.info("jQuery加载完成")
-            except:
-                logger.debug("未检测到jQuery或页面不使用jQuery")
+            # 如果页面使用jQuery，等待请求完成；未使用jQuery时条件立即成立
+            self.waiter.quietly(
+                self.driver, 'page_load',
+                lambda driver: driver.execute_script("return typeof jQuery == 'undefined' || jQuery.active == 0"),
+                timeout=5
+            )
             
-            # 额外等待动态内容
-            time.sleep(3)
+            # 等待动态内容渲染稳定，而不是固定等待
+            self.waiter.quietly(self.driver, 'dom_settle', dom_settled(), poll=0.3)
             return True
             
         except Exception as e:
             logger.warning(f"页面就绪检查超时: {e}")
             return False
     
-    def switch_to_checkin_iframe(self):
-        """检查并切换到包含签到按钮的iframe"""
+    def probe(self, candidates, timeout, step, frames_only=False, poll=0.25):
+        """在共同的截止时间内轮询单次往返的DOM探测。
+        
+        candidates 为 [(类型, 选择器)]，返回第一个可见匹配 {selector, text, enabled, element, in_frame}；
+        匹配位于iframe中时，驱动会停留在该iframe内。超时返回None。
+        """
         try:
-            iframes = self.driver.find_elements(By.TAG_NAME, "iframe")
-            logger.info(f"页面上找到 {len(iframes)} 个iframe")
-            
-            if len(iframes) == 0:
-                return False
-            
-            for i, iframe in enumerate(iframes):
+            self.driver.switch_to.default_content()
+        except Exception:
+            pass
+        candidates = [list(c) for c in candidates]
+        
+        def condition(driver):
+            result = driver.execute_script(PROBE_SCRIPT, candidates, frames_only)
+            if result and result.get('index', -1) >= 0:
+                return self._resolve_probe_match(candidates, result)
+            # 跨域iframe无法在脚本中访问，逐个切换进去再探测一次
+            for frame in (result or {}).get('crossOrigin') or []:
                 try:
-                    self.driver.switch_to.frame(iframe)
-                    logger.info(f"切换到iframe {i}")
-                    
-                    # 尝试查找签到按钮
-                    try:
-                        checkin_btn = self.driver.find_element(By.CSS_SELECTOR, "button.checkin-btn")
-                        if checkin_btn.is_displayed():
-                            logger.info(f"在iframe {i} 中找到签到按钮")
-                            return True
-                    except:
-                        pass
-                    
-                    # 尝试其他选择器
-                    try:
-                        checkin_btn = self.driver.find_element(By.XPATH, "//button[contains(text(), '签到')]")
-                        if checkin_btn.is_displayed():
-                            logger.info(f"在iframe {i} 中找到签到按钮（通过xpath）")
-                            return True
-                    except:
-                        pass
-                    
-                    # 如果没找到，切换回主页面
-                    self.driver.switch_to.default_content()
+                    driver.switch_to.frame(frame)
+                    inner = driver.execute_script(PROBE_SCRIPT, candidates, False)
+                    if inner and inner.get('index', -1) >= 0 and inner.get('element') is not None:
+                        inner['in_frame'] = True
+                        return self._resolve_probe_match(candidates, inner)
                 except Exception as e:
-                    logger.debug(f"检查iframe {i} 时出错: {e}")
-                    try:
-                        self.driver.switch_to.default_content()
-                    except:
-                        pass
-                    continue
-            
-            return False
-        except Exception as e:
-            logger.error(f"检查iframe时出错: {e}")
+                    logger.debug(f"探测跨域iframe失败: {e}")
+                driver.switch_to.default_content()
             return False
         
+        return self.waiter.quietly(self.driver, step, condition, timeout=timeout, poll=poll)
+    
+    def _resolve_probe_match(self, candidates, result):
+        """把探测结果整理为统一结构；同源iframe中的匹配需要切进iframe取回元素引用"""
+        selector_type, selector = candidates[result['index']]
+        element = result.get('element')
+        in_frame = bool(result.get('in_frame'))
+        if result.get('frame') is not None:
+            self.driver.switch_to.frame(result['frame'])
+            in_frame = True
+            inner = self.driver.execute_script(PROBE_SCRIPT, [[selector_type, selector]], False)
+            element = inner.get('element') if inner else None
+            if element is None:
+                self.driver.switch_to.default_content()
+                return False
+        return {
+            'selector_type': selector_type,
+            'selector': selector,
+            'text': result.get('text', ''),
+            'enabled': result.get('enabled', True),
+            'element': element,
+            'in_frame': in_frame,
+        }
+    
+    def probe_learned(self, group, candidates, timeout, step, frames_only=False):
+        """按历史命中率排序后单次探测，并更新选择器统计"""
+        stats = get_selector_stats()
+        ordered = stats.order(group, candidates)
+        match = self.probe(ordered, timeout, step, frames_only=frames_only)
+        if match:
+            stats.record_hit(group, match['selector'])
+        elif ordered:
+            stats.record_miss(group, ordered[0][1])
+        return match
+    
+    @timed_phase('popup_close')
     def close_popup(self):
         """关闭初始弹窗"""
         try:
             logger.info("尝试关闭初始弹窗...")
-            time.sleep(3)  # 等待弹窗加载
+            
+            # 等待弹窗出现，预算内未出现则无需关闭
+            popup_visible = lambda driver: driver.execute_script(
+                "return Array.from(document.querySelectorAll(arguments[0])).some(e => e.offsetParent !== null || getComputedStyle(e).position === 'fixed');",
+                POPUP_SELECTORS
+            )
+            if not self.waiter.quietly(self.driver, 'popup', popup_visible):
+                logger.info("未检测到弹窗")
+                return False
             
             # 尝试关闭弹窗
             try:
                 actions = ActionChains(self.driver)
                 actions.move_by_offset(10, 10).click().perform()
+                self.waiter.quietly(self.driver, 'popup_close', lambda driver: not popup_visible(driver))
                 logger.info("已成功关闭弹窗")
-                time.sleep(2)
                 return True
             except:
                 pass
@@ -191,25 +2259,42 @@ class LeaflowAutoCheckin:
             logger.warning(f"关闭弹窗时出错: {e}")
             return False
     
-    def wait_for_element_clickable(self, by, value, timeout=10):
-        """等待元素可点击"""
-        return WebDriverWait(self.driver, timeout).until(
-            EC.element_to_be_clickable((by, value))
-        )
-    
-    def wait_for_element_present(self, by, value, timeout=10):
-        """等待元素出现"""
-        return WebDriverWait(self.driver, timeout).until(
-            EC.presence_of_element_located((by, value))
-        )
+    def find_learned(self, group, selectors, condition, timeout, step):
+        """按历史命中率顺序尝试选择器，返回 (selector, element)；已知的命中者先用短超时探测"""
+        stats = get_selector_stats()
+        for i, (selector_type, selector) in enumerate(stats.order(group, selectors)):
+            by = By.XPATH if selector_type == "xpath" else By.CSS_SELECTOR
+            probe_timeout = min(2, timeout) if i == 0 and stats.is_known(group, selector) else timeout
+            try:
+                element = self.waiter.until(self.driver, step, condition((by, selector)), timeout=probe_timeout)
+            except Exception as e:
+                logger.debug(f"选择器 {selector} 未找到元素: {e}")
+                stats.record_miss(group, selector)
+                continue
+            stats.record_hit(group, selector)
+            return selector, element
+        return None, None
     
+    @timed_phase('login')
     def login(self):
-        """执行登录流程"""
+        """执行登录流程。登录页可能显示图形验证码，登录期间放行图片，结束后恢复完整的资源拦截规则"""
+        categories = resource_block_categories()
+        if 'images' not in categories:
+            return self.submit_login()
+        apply_resource_blocking(self.driver, [c for c in categories if c != 'images'], quiet=True)
+        try:
+            return self.submit_login()
+        finally:
+            apply_resource_blocking(self.driver, categories, quiet=True)
+    
+    def submit_login(self):
+        """打开登录页，填写并提交登录表单，等待登录结果"""
         logger.info(f"开始登录流程")
         
         # 访问登录页面
-        self.driver.get("https://leaflow.net/login")
-        time.sleep(5)
+        self.navigate(f"{LEAFLOW_URL}/login")
+        self.waiter.quietly(self.driver, 'page_load', document_ready)
+        self.record_page_bytes('login')
         
         # 关闭弹窗
         self.close_popup()
@@ -218,37 +2303,29 @@ class LeaflowAutoCheckin:
         try:
             logger.info("查找邮箱输入框...")
             
-            # 等待页面稳定
-            time.sleep(2)
-            
             # 尝试多种选择器找到邮箱输入框
             email_selectors = [
-                "input[type='text']",
-                "input[type='email']", 
-                "input[placeholder*='邮箱']",
-                "input[placeholder*='邮件']",
-                "input[placeholder*='email']",
-                "input[name='email']",
-                "input[name='username']"
+                ("css", "input[type='text']"),
+                ("css", "input[type='email']"),
+                ("css", "input[placeholder*='邮箱']"),
+                ("css", "input[placeholder*='邮件']"),
+                ("css", "input[placeholder*='email']"),
+                ("css", "input[name='email']"),
+                ("css", "input[name='username']"),
             ]
             
-            email_input = None
-            for selector in email_selectors:
-                try:
-                    email_input = self.wait_for_element_clickable(By.CSS_SELECTOR, selector, 5)
-                    logger.info(f"找到邮箱输入框: {selector}")
-                    break
-                except:
-                    continue
-            
-            if not email_input:
+            selector, email_input = self.find_learned(
+                'login_email', email_selectors, EC.element_to_be_clickable, 5, 'login_form'
+            )
+            if email_input:
+                logger.info(f"找到邮箱输入框: {selector}")
+            else:
                 raise Exception("找不到邮箱输入框")
             
             # 清除并输入邮箱
             email_input.clear()
             email_input.send_keys(self.email)
             logger.info("邮箱输入完成")
-            time.sleep(2)
             
         except Exception as e:
             logger.error(f"输入邮箱时出错: {e}")
@@ -256,7 +2333,6 @@ class LeaflowAutoCheckin:
             try:
                 self.driver.execute_script(f"document.querySelector('input[type=\"text\"], input[type=\"email\"]').value = '{self.email}';")
                 logger.info("通过JavaScript设置邮箱")
-                time.sleep(2)
             except:
                 raise Exception(f"无法输入邮箱: {e}")
         
@@ -265,119 +2341,185 @@ class LeaflowAutoCheckin:
             logger.info("查找密码输入框...")
             
             # 等待密码框出现
-            password_input = self.wait_for_element_clickable(
-                By.CSS_SELECTOR, "input[type='password']", 10
+            password_input = self.waiter.until(
+                self.driver, 'login_form', EC.element_to_be_clickable((By.CSS_SELECTOR, "input[type='password']"))
             )
             
             password_input.clear()
             password_input.send_keys(self.password)
             logger.info("密码输入完成")
-            time.sleep(1)
             
-        except TimeoutException:
+        except selenium_timeout():
             raise Exception("找不到密码输入框")
         
         # 点击登录按钮
         try:
             logger.info("查找登录按钮...")
             login_btn_selectors = [
-                "//button[contains(text(), '登录')]",
-                "//button[contains(text(), 'Login')]",
-                "//button[@type='submit']",
-                "//input[@type='submit']",
-                "button[type='submit']"
+                ("xpath", "//button[contains(text(), '登录')]"),
+                ("xpath", "//button[contains(text(), 'Login')]"),
+                ("xpath", "//button[@type='submit']"),
+                ("xpath", "//input[@type='submit']"),
+                ("css", "button[type='submit']"),
             ]
             
-            login_btn = None
-            for selector in login_btn_selectors:
-                try:
-                    if selector.startswith("//"):
-                        login_btn = self.wait_for_element_clickable(By.XPATH, selector, 5)
-                    else:
-                        login_btn = self.wait_for_element_clickable(By.CSS_SELECTOR, selector, 5)
-                    logger.info(f"找到登录按钮: {selector}")
-                    break
-                except:
-                    continue
-            
+            selector, login_btn = self.find_learned(
+                'login_button', login_btn_selectors, EC.element_to_be_clickable, 5, 'login_form'
+            )
             if not login_btn:
                 raise Exception("找不到登录按钮")
+            logger.info(f"找到登录按钮: {selector}")
             
+            # 点击前开始观察网络事件，登录POST的响应一到即可判断结果
+            watch = LoginNetworkWatch.start(self.driver)
             login_btn.click()
             logger.info("已点击登录按钮")
             
         except Exception as e:
             raise Exception(f"点击登录按钮失败: {e}")
         
-        # 等待登录完成
+        budget = self.waiter.budget('login_redirect')
+        started = time.monotonic()
+        if watch:
+            outcome = self.waiter.quietly(self.driver, 'login_redirect', watch, poll=0.1)
+            if outcome:
+                return self.finish_login(*outcome)
+            logger.info("网络事件中未找到登录结果，改为检查当前URL")
+        
+        # 等待登录完成（与网络事件共用 login_redirect 预算）
         try:
-            WebDriverWait(self.driver, 20).until(
-                lambda driver: "dashboard" in driver.current_url or "workspaces" in driver.current_url or "login" not in driver.current_url
+            self.waiter.until(
+                self.driver, 'login_redirect',
+                lambda driver: "dashboard" in driver.current_url or "workspaces" in driver.current_url or "login" not in driver.current_url,
+                timeout=max(0.0, budget - (time.monotonic() - started))
             )
             
             # 检查当前URL确认登录成功
             current_url = self.driver.current_url
             if "dashboard" in current_url or "workspaces" in current_url or "login" not in current_url:
                 logger.info(f"登录成功，当前URL: {current_url}")
+                # 登录后落在仪表板时顺便读取余额，今日已签到时可直接复用
+                if "dashboard" in current_url:
+                    self.dashboard_balance = self.read_balance_in_page()
                 return True
             else:
                 raise Exception("登录后未跳转到正确页面")
                 
-        except TimeoutException:
+        except selenium_timeout():
             # 检查是否登录失败
-            try:
-                error_selectors = [".error", ".alert-danger", "[class*='error']", "[class*='danger']"]
-                for selector in error_selectors:
-                    try:
-                        error_msg = self.driver.find_element(By.CSS_SELECTOR, selector)
-                        if error_msg.is_displayed():
-                            raise Exception(f"登录失败: {error_msg.text}")
-                    except:
-                        continue
-                raise Exception("登录超时，无法确认登录状态")
-            except Exception as e:
-                raise e
+            rejection = self.driver.execute_script(LOGIN_REJECTION_SCRIPT) or {}
+            if rejection.get('error'):
+                raise Exception(f"登录失败: {rejection['error']}")
+            raise Exception("登录超时，无法确认登录状态")
+    
+    def finish_login(self, kind, status, url):
+        """按网络事件判断的登录结果收尾：成功时等待跳转完成，失败时读取页面上的原因并抛出异常"""
+        logger.info(f"登录请求结果: {kind} (HTTP {status}) -> {url}")
+        if kind == 'success':
+            self.waiter.quietly(self.driver, 'login_redirect',
+                                lambda driver: not is_login_url(driver.current_url) and document_ready(driver), poll=0.1)
+            current_url = self.driver.current_url
+            logger.info(f"登录成功，当前URL: {current_url}")
+            # 登录后落在仪表板时顺便读取余额，今日已签到时可直接复用
+            if "dashboard" in current_url:
+                self.dashboard_balance = self.read_balance_in_page()
+            return True
+        if kind == 'throttled':
+            raise HttpThrottledError(f"登录请求被限流 (HTTP {status})")
+        if kind in ('server_error', 'expired'):
+            raise HttpTransientError(f"登录请求失败 (HTTP {status})")
+        
+        # 被拒绝：等重新渲染的登录页就绪后一次读取错误提示，区分验证码和账号密码错误
+        self.waiter.quietly(self.driver, 'page_load', document_ready, poll=0.1)
+        try:
+            rejection = self.driver.execute_script(LOGIN_REJECTION_SCRIPT) or {}
+        except Exception:
+            rejection = {}
+        if kind == 'captcha' or rejection.get('captcha'):
+            raise Exception(f"登录失败: 需要人机验证 {rejection.get('error', '')}".rstrip())
+        raise LoginFailedError(f"登录失败: {rejection.get('error') or '账号或密码错误'}")
+    
+    @timed_phase('session_restore')
+    def restore_session(self):
+        """尝试恢复缓存的会话，有效时写入浏览器并跳过登录"""
+        cookies = self.session_cache.load(self.email)
+        if not cookies:
+            return False
+        
+        if not SessionCache.is_valid(cookies):
+            logger.info("缓存会话已失效，执行完整登录")
+            self.session_cache.invalidate(self.email)
+            return False
+        
+        try:
+            # 通过CDP直接写入cookie，无需先导航到对应域名
+            for c in cookies:
+                cookie = {k: c[k] for k in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires') if k in c}
+                if cookie.get('expires', -1) <= 0:
+                    cookie.pop('expires', None)
+                self.driver.execute_cdp_cmd('Network.setCookie', cookie)
+        except Exception as e:
+            logger.warning(f"恢复会话到浏览器失败: {e}")
+            return False
+        
+        logger.info("✅ 已恢复缓存会话，跳过登录")
+        return True
+    
+    def save_session(self):
+        """保存当前浏览器的全部cookies（包括签到子域）"""
+        if not self.session_cache.enabled:
+            return
+        try:
+            cookies = self.driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+            cookies = [c for c in cookies
+                       if c.get('domain', '').lstrip('.') in (LEAFLOW_HOST, CHECKIN_HOST)
+                       or CHECKIN_HOST.endswith('.' + c.get('domain', '').lstrip('.'))]
+            self.session_cache.save(self.email, cookies)
+        except Exception as e:
+            logger.debug(f"获取cookies失败: {e}")
+    
+    def read_balance_in_page(self):
+        """在当前页面内一次脚本调用解析余额，找不到返回None"""
+        try:
+            return self.driver.execute_script(BALANCE_SCRIPT)
+        except Exception as e:
+            logger.debug(f"页面内解析余额失败: {e}")
+            return None
+    
+    def fetch_balance_via_api(self):
+        """带上浏览器cookies请求JSON余额接口，不产生页面导航"""
+        if not BALANCE_API_PATHS or all(p in _missing_balance_apis for p in BALANCE_API_PATHS):
+            return None
+        try:
+            return fetch_balance_api(self.api_session())
+        except Exception as e:
+            logger.debug(f"余额接口获取失败: {e}")
+            return None
     
+    @timed_phase('balance_fetch', failed=lambda result: result == "未知")
     def get_balance(self):
-        """获取当前账号的总余额"""
+        """获取当前账号的总余额，最多一次页面导航"""
         try:
             logger.info("获取账号余额...")
             
-            # 跳转到仪表板页面
-            self.driver.get("https://leaflow.net/dashboard")
-            time.sleep(3)
+            balance = None
+            # 已经在仪表板上时直接解析
+            if '/dashboard' in self.driver.current_url:
+                balance = self.read_balance_in_page()
             
-            # 等待页面加载
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
+            # JSON余额接口
+            if not balance:
+                balance = self.fetch_balance_via_api()
             
-            # 尝试多种选择器查找余额元素
-            balance_selectors = [
-                "//*[contains(text(), '¥') or contains(text(), '￥') or contains(text(), '元')]",
-                "//*[contains(@class, 'balance')]",
-                "//*[contains(@class, 'money')]",
-                "//*[contains(@class, 'amount')]",
-                "//button[contains(@class, 'dollar')]",
-                "//span[contains(@class, 'font-medium')]"
-            ]
+            # 最后才跳转到仪表板，轮询同一个脚本直到余额渲染出来
+            if not balance:
+                self.navigate(f"{LEAFLOW_URL}/dashboard")
+                balance = self.waiter.quietly(self.driver, 'balance', lambda driver: driver.execute_script(BALANCE_SCRIPT))
+                self.record_page_bytes('dashboard')
             
-            for selector in balance_selectors:
-                try:
-                    elements = self.driver.find_elements(By.XPATH, selector)
-                    for element in elements:
-                        text = element.text.strip()
-                        # 查找包含数字和货币符号的文本
-                        if any(char.isdigit() for char in text) and ('¥' in text or '￥' in text or '元' in text):
-                            # 提取数字部分
-                            import re
-                            numbers = re.findall(r'\d+\.?\d*', text)
-                            if numbers:
-                                balance = numbers[0]
-                                logger.info(f"找到余额: {balance}元")
-                                return f"{balance}元"
-                except:
-                    continue
+            if balance:
+                logger.info(f"找到余额: {balance}元")
+                return f"{balance}元"
             
             logger.warning("未找到余额信息")
             return "未知"
@@ -386,20 +2528,21 @@ class LeaflowAutoCheckin:
             logger.warning(f"获取余额时出错: {e}")
             return "未知"
     
-    def wait_for_checkin_page_loaded(self, max_retries=5, wait_time=30):
-        """增强版签到页面加载等待 - 支持多次重试和调试"""
+    @timed_phase('checkin_page_load')
+    def wait_for_checkin_page_loaded(self, max_retries=None, wait_time=30):
+        """增强版签到页面加载等待 - 按 checkin_page 重试策略退避后刷新重试"""
+        policy = get_retry_policy('checkin_page')
+        max_retries = max_retries or policy.attempts
         for attempt in range(max_retries):
             logger.info(f"尝试 {attempt + 1}/{max_retries} 加载签到页面...")
+            self.span_note(attempts=attempt + 1)
             
             # 等待页面完全就绪
             self.wait_for_page_ready(timeout=wait_time)
+            if attempt == 0:
+                self.record_page_bytes('checkin')
             
-            # 检查iframe
-            if self.switch_to_checkin_iframe():
-                logger.info("在iframe中找到签到按钮")
-                return True
-            
-            # 尝试所有可能的选择器
+            # 所有可能的选择器（主页面和同源iframe一次探测）
             all_selectors = [
                 ("css", "button.checkin-btn"),
                 ("css", "button[class*='checkin']"),
@@ -418,22 +2561,11 @@ class LeaflowAutoCheckin:
                 ("css", "div[class*='checkin'] button"),
             ]
             
-            for selector_type, selector in all_selectors:
-                try:
-                    if selector_type == "css":
-                        element = WebDriverWait(self.driver, 3).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                        )
-                    else:
-                        element = WebDriverWait(self.driver, 3).until(
-                            EC.presence_of_element_located((By.XPATH, selector))
-                        )
-                    
-                    if element.is_displayed():
-                        logger.info(f"✅ 找到签到元素 (选择器: {selector})")
-                        return True
-                except:
-                    continue
+            match = self.locate_checkin_element(all_selectors)
+            if match:
+                where = "iframe中" if match['in_frame'] else "页面上"
+                logger.info(f"✅ 在{where}找到签到元素 (选择器: {match['selector']})")
+                return True
             
             # 如果是最后一次尝试，保存调试信息
             if attempt == max_retries - 1:
@@ -441,20 +2573,27 @@ class LeaflowAutoCheckin:
                 self.debug_page_state(f"checkin_failed_{int(time.time())}")
                 return False
             
-            # 否则刷新页面重试
-            logger.warning(f"第 {attempt + 1} 次未找到签到按钮，刷新页面重试...")
-            self.driver.refresh()
-            time.sleep(5)
+            # 否则退避后刷新页面重试
+            delay = policy.delay(attempt)
+            logger.warning(f"第 {attempt + 1} 次未找到签到按钮，{delay:.1f}秒后刷新页面重试...")
+            time.sleep(delay)
+            self.navigate()
         
         return False
     
+    @timed_phase('iframe_scan', failed=lambda match: not match)
+    def locate_checkin_element(self, selectors):
+        """在主页面和全部iframe中探测签到元素，匹配位于iframe中时驱动停留在该iframe内"""
+        return self.probe_learned('checkin_page', selectors, self.waiter.budget('checkin_probe'), 'checkin_probe')
+    
+    @timed_phase('click')
     def find_and_click_checkin_button(self):
         """查找并点击签到按钮 - 处理已签到状态"""
         logger.info("查找签到按钮...")
         
         try:
-            # 先等待页面可能的重载
-            time.sleep(3)
+            # 等待页面可能的重载完成
+            self.waiter.quietly(self.driver, 'dom_settle', dom_settled(), poll=0.3)
             
             # 使用更全面的选择器列表
             checkin_selectors = [
@@ -469,52 +2608,42 @@ class LeaflowAutoCheckin:
                 ("css", "a.checkin-btn"),
             ]
             
-            for selector_type, selector in checkin_selectors:
+            match = self.probe_learned('checkin_button', checkin_selectors, self.waiter.budget('checkin_probe'), 'checkin_probe')
+            if match:
+                # 文本和可用状态随探测一起返回，无需额外往返
+                checkin_btn = match['element']
+                selector = match['selector']
+                btn_text = match['text']
+                logger.info(f"找到按钮，文本: '{btn_text}'")
+                
+                if "已签到" in btn_text or "已完成" in btn_text:
+                    logger.info("今日已经签到过了！")
+                    return "already_checked_in"
+                
+                # 检查按钮是否可用
+                if not match['enabled']:
+                    logger.info("签到按钮不可用，可能已经签到过了")
+                    return "already_checked_in"
+                
+                logger.info(f"找到并点击签到按钮 (选择器: {selector})")
+                
+                # 尝试滚动到按钮位置
                 try:
-                    if selector_type == "css":
-                        checkin_btn = WebDriverWait(self.driver, 10).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                        )
-                    else:
-                        checkin_btn = WebDriverWait(self.driver, 10).until(
-                            EC.presence_of_element_located((By.XPATH, selector))
-                        )
-                    
-                    if checkin_btn.is_displayed():
-                        # 检查按钮文本，如果包含"已签到"则说明今天已经签到过了
-                        btn_text = checkin_btn.text.strip()
-                        logger.info(f"找到按钮，文本: '{btn_text}'")
-                        
-                        if "已签到" in btn_text or "已完成" in btn_text:
-                            logger.info("今日已经签到过了！")
-                            return "already_checked_in"
-                        
-                        # 检查按钮是否可用
-                        if checkin_btn.is_enabled():
-                            logger.info(f"找到并点击签到按钮 (选择器: {selector})")
-                            
-                            # 尝试滚动到按钮位置
-                            try:
-                                self.driver.execute_script("arguments[0].scrollIntoView(true);", checkin_btn)
-                                time.sleep(1)
-                            except:
-                                pass
-                            
-                            # 点击按钮
-                            try:
-                                checkin_btn.click()
-                            except:
-                                # 如果普通点击失败，使用JavaScript点击
-                                self.driver.execute_script("arguments[0].click();", checkin_btn)
-                            
-                            return True
-                        else:
-                            logger.info("签到按钮不可用，可能已经签到过了")
-                            return "already_checked_in"
-                        
-                except Exception as e:
-                    logger.debug(f"选择器 {selector} 未找到按钮: {e}")
-                    continue
+                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", checkin_btn)
+                except:
+                    pass
+                
+                # 点击前注入观察器，点击后由 get_checkin_result 等待第一个结果变化
+                self._result_observer = self.install_result_observer(checkin_btn)
+                
+                # 点击按钮
+                try:
+                    checkin_btn.click()
+                except:
+                    # 如果普通点击失败，使用JavaScript点击
+                    self.driver.execute_script("arguments[0].click();", checkin_btn)
+                
+                return True
             
             logger.error("❌ 找不到签到按钮")
             self.debug_page_state(f"no_button_{int(time.time())}")
@@ -524,44 +2653,75 @@ class LeaflowAutoCheckin:
             logger.error(f"查找签到按钮时出错: {e}")
             return False
     
+    def api_session(self):
+        """带有浏览器全部cookies的连接池Session，同一账号内只构建一次"""
+        if self._api_session is None:
+            session = create_http_session()
+            session.headers['Accept'] = 'application/json'
+            cookies = self.driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+            SessionCache.apply_to_session(session, cookies)
+            self._api_session = session
+        return self._api_session
+    
+    @staticmethod
+    def _post_checkin_api(session, url, timeout=10):
+        """POST签到接口，返回解析后的结果；响应不像签到接口时返回None"""
+        response = session.post(url, timeout=timeout)
+        logger.info(f"API端点 {url} 响应状态码: {response.status_code}")
+        if response.status_code != 200 or 'login' in urlparse(response.url).path:
+            return None
+        # 只有明确表示签到成功或今日已签到的JSON响应才算命中；HTML页面（前端路由兜底等）一律视为未命中
+        try:
+            result = response.json()
+        except ValueError:
+            return None
+        return result if is_checkin_payload(result) else None
+    
     def checkin_via_api(self):
-        """尝试通过API签到（备用方案）"""
+        """尝试通过API签到（备用方案）：优先使用缓存的可用端点，否则并发探测所有候选端点"""
         try:
             logger.info("尝试API签到...")
+            session = self.api_session()
+            endpoints = get_endpoint_cache()
             
-            # 从浏览器会话获取cookies
-            cookies = {cookie['name']: cookie['value'] for cookie in self.driver.get_cookies()}
+            cached_url = endpoints.get('checkin')
+            if cached_url:
+                try:
+                    result = self._post_checkin_api(session, cached_url)
+                    if result is not None:
+                        logger.info(f"✅ API签到成功（缓存端点）: {cached_url}")
+                        return result
+                except requests.RequestException as e:
+                    logger.debug(f"缓存端点 {cached_url} 失败: {e}")
+                logger.info("缓存的API端点已失效，重新探测")
+                endpoints.invalidate('checkin')
             
-            # 尝试常见的签到API端点
+            # 尝试常见的签到API端点（并发探测）
             api_urls = [
-                "https://leaflow.net/api/checkin",
-                "https://checkin.leaflow.net/api/checkin",
-                "https://leaflow.net/api/user/checkin",
-                "https://leaflow.net/user/checkin",
+                f"{LEAFLOW_URL}/api/checkin",
+                f"{CHECKIN_URL}/api/checkin",
+                f"{LEAFLOW_URL}/api/user/checkin",
+                f"{LEAFLOW_URL}/user/checkin",
             ]
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'application/json',
-            }
-            
-            for url in api_urls:
-                try:
-                    logger.info(f"尝试API端点: {url}")
-                    response = requests.post(url, cookies=cookies, headers=headers, timeout=10)
-                    logger.info(f"API响应状态码: {response.status_code}")
-                    
-                    if response.status_code == 200:
+            # 不使用with：拿到第一个正确响应后立即返回，不等待较慢的端点超时
+            executor = ThreadPoolExecutor(max_workers=len(api_urls), thread_name_prefix="api-probe")
+            try:
+                futures = {executor.submit(self._post_checkin_api, session, url): url for url in api_urls}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.debug(f"API端点 {url} 失败: {e}")
+                        continue
+                    if result is not None:
                         logger.info(f"✅ API签到成功: {url}")
-                        try:
-                            result = response.json()
-                            logger.info(f"API返回: {result}")
-                            return result
-                        except:
-                            return {"success": True, "message": "API签到成功"}
-                except Exception as e:
-                    logger.debug(f"API端点 {url} 失败: {e}")
-                    continue
+                        logger.info(f"API返回: {result}")
+                        endpoints.set('checkin', url)
+                        return result
+            finally:
+                executor.shutdown(wait=False)
             
             logger.warning("所有API端点都失败了")
             return None
@@ -569,191 +2729,1133 @@ class LeaflowAutoCheckin:
             logger.error(f"API签到失败: {e}")
             return None
     
-    def checkin(self):
-        """执行签到流程 - 增强版"""
-        logger.info("跳转到签到页面...")
-        
-        # 跳转到签到页面
-        self.driver.get("https://checkin.leaflow.net")
+    def checkin(self):
+        """执行签到流程 - 增强版"""
+        logger.info("跳转到签到页面...")
+        
+        # 跳转到签到页面
+        self.navigate(CHECKIN_URL)
+        
+        # 等待签到页面加载（最多重试5次，每次等待30秒）
+        if not self.wait_for_checkin_page_loaded(wait_time=30):
+            logger.warning("UI签到页面加载失败，尝试API签到...")
+            
+            # 尝试API签到作为备用方案
+            api_result = self.checkin_via_api()
+            if api_result:
+                return "API签到成功"
+            
+            raise Exception("签到页面加载失败，UI和API方式都无法签到")
+        
+        # 查找并点击签到按钮
+        checkin_result = self.find_and_click_checkin_button()
+        
+        if checkin_result == "already_checked_in":
+            return "今日已签到"
+        elif checkin_result is True:
+            logger.info("已点击签到按钮")
+            
+            # 获取签到结果
+            result_message = self.get_checkin_result()
+            return result_message
+        else:
+            # 最后尝试API签到
+            logger.warning("无法点击签到按钮，尝试API签到...")
+            api_result = self.checkin_via_api()
+            if api_result:
+                return "API签到成功"
+            
+            raise Exception("找不到签到按钮或按钮不可点击，且API签到也失败")
+    
+    CHECKIN_RESULT_SELECTORS = [
+        ".alert-success",
+        ".success",
+        ".message",
+        "[class*='success']",
+        "[class*='message']",
+        ".modal-content",  # 弹窗内容
+        ".ant-message",    # Ant Design 消息
+        ".el-message",     # Element UI 消息
+        ".toast",          # Toast消息
+        ".notification"    # 通知
+    ]
+    
+    CHECKIN_RESULT_KEYWORDS = ["成功", "签到", "获得", "恭喜", "谢谢", "感谢", "完成", "已签到", "连续签到"]
+    
+    def checkin_result_visible(self, driver):
+        """签到结果是否已出现：提示消息可见或签到按钮变为已签到/禁用"""
+        return driver.execute_script("""
+            const visible = e => e.offsetParent !== null && e.innerText.trim();
+            if (arguments[0].some(s => Array.from(document.querySelectorAll(s)).some(visible))) return true;
+            const btn = document.querySelector('button.checkin-btn');
+            return !!btn && (btn.disabled || btn.innerText.includes('已签到') || btn.className.includes('disabled'));
+        """, self.CHECKIN_RESULT_SELECTORS)
+    
+    def install_result_observer(self, button):
+        """在签到按钮所在的文档中注入结果观察器，失败时返回False（结果改为轮询读取）"""
+        try:
+            self.driver.execute_script(CHECKIN_OBSERVER_SCRIPT, self.CHECKIN_RESULT_SELECTORS, button)
+            return True
+        except Exception as e:
+            logger.debug(f"注入签到结果观察器失败: {e}")
+            return False
+    
+    def describe_result(self, event):
+        """把观察器或兜底扫描的结果整理为结果消息"""
+        if event.get('kind') == 'button':
+            return "签到完成"
+        text = event.get('text', '').strip()
+        if event.get('kind') == 'page':
+            logger.info(f"从页面文本找到结果: {text}")
+        else:
+            logger.info(f"找到签到结果消息: {text}")
+        return text
+    
+    @timed_phase('result_read')
+    def get_checkin_result(self):
+        """获取签到结果消息"""
+        try:
+            wait = True
+            if self._result_observer:
+                self._result_observer = False
+                try:
+                    event = self.waiter.script(self.driver, 'checkin_result', CHECKIN_RESULT_WAIT_SCRIPT,
+                                               int(self.waiter.budget('checkin_toast') * 1000))
+                    if event and event.get('kind') != 'missing':
+                        return self.describe_result(event)
+                    # 预算内没有变化时不再重复等待，直接读取一次页面
+                    wait = event is not None
+                except Exception as e:
+                    # 点击触发整页跳转（表单提交）时观察器随旧页面一起销毁，改为在新页面上读取
+                    logger.debug(f"签到结果观察器不可用: {e}")
+            
+            # 等待结果消息或按钮状态变化出现，然后一次往返读取
+            if wait:
+                self.waiter.quietly(self.driver, 'checkin_result', self.checkin_result_visible, poll=0.25)
+            event = self.driver.execute_script(CHECKIN_RESULT_SCAN_SCRIPT, self.CHECKIN_RESULT_SELECTORS,
+                                               self.CHECKIN_RESULT_KEYWORDS)
+            if event:
+                return self.describe_result(event)
+            
+            return "签到完成，但未找到具体结果消息"
+            
+        except Exception as e:
+            return f"获取签到结果时出错: {str(e)}"
+    
+    def http_steps(self, client):
+        """HTTP快速路径的步骤序列。
+        
+        每一步 yield (主机, 无参可调用对象)，由调用方执行后把返回值 send 回来；
+        同步执行见 run_http，异步调度见 AsyncCheckinRunner。最终返回 (result, balance)。
+        """
+        logged_in = False
+        cookies = self.session_cache.load(self.email)
+        if cookies:
+            SessionCache.apply_to_session(client.session, cookies)
+            logged_in = yield LEAFLOW_HOST, client.is_logged_in
+            if logged_in:
+                logger.info("✅ 已恢复缓存会话，跳过登录")
+            else:
+                self.session_cache.invalidate(self.email)
+        if not logged_in:
+            yield LEAFLOW_HOST, client.login
+        
+        result = yield CHECKIN_HOST, client.checkin
+        balance = yield LEAFLOW_HOST, client.get_balance
+        self.session_cache.save(self.email, client.export_cookies())
+        
+        logger.info(f"✅ 签到结果: {result}, 余额: {balance}")
+        return result, balance
+    
+    def http_failure(self, error):
+        """HTTP路径异常的处理：确定性失败返回结果元组，需要回退到浏览器时返回None"""
+        if isinstance(error, LoginFailedError):
+            logger.error(f"❌ {error}")
+            self.session_cache.invalidate(self.email)
+            return False, f"自动签到失败: {str(error)}", "未知"
+        if isinstance(error, (HttpChallengeError, requests.RequestException)):
+            logger.info(f"HTTP路径无法完成，改用浏览器: {error}")
+        else:
+            logger.warning(f"HTTP路径出现意外错误，改用浏览器: {error}")
+        return None
+    
+    def run_http(self):
+        """HTTP快速路径，返回 (success, result, balance)；需要回退到浏览器时返回None"""
+        client = LeaflowHttpClient(self.email, self.password)
+        try:
+            steps = self.http_steps(client)
+            value = None
+            while True:
+                try:
+                    _, step = steps.send(value)
+                except StopIteration as stop:
+                    result, balance = stop.value
+                    return True, result, balance
+                with get_run_metrics().span(self.email, HTTP_STEP_PHASES.get(step.__name__, step.__name__), engine='http') as record:
+                    value = get_retry_policy('http_step').call(step, on_retry=lambda n: record.update(attempts=n))
+        except Exception as e:
+            return self.http_failure(e)
+        finally:
+            client.close()
+    
+    def run(self, skip_http=False):
+        """单个账号执行流程；skip_http=True 表示HTTP路径已由调用方尝试过"""
+        started = time.monotonic()
+        try:
+            logger.info(f"开始处理账号: {mask_email(self.email)}")
+            
+            if self.http_first and not skip_http:
+                outcome = self.run_http()
+                if outcome is not None:
+                    return outcome
+            
+            if self.driver is None:
+                self.setup_driver()
+            
+            # 优先恢复缓存会话，失效时再登录
+            if self.restore_session() or self.login():
+                # 签到
+                result = self.checkin()
+                self.save_session()
+                
+                # 获取余额：今日已签到时余额不变，复用登录后读到的仪表板余额
+                if result == "今日已签到" and self.dashboard_balance:
+                    balance = f"{self.dashboard_balance}元"
+                else:
+                    balance = self.get_balance()
+                
+                logger.info(f"✅ 签到结果: {result}, 余额: {balance}")
+                return True, result, balance
+            else:
+                raise Exception("登录失败")
+                
+        except Exception as e:
+            error_msg = f"自动签到失败: {str(e)}"
+            logger.error(f"❌ {error_msg}")
+            # 失败时丢弃会话缓存，下次运行走完整登录
+            self.session_cache.invalidate(self.email)
+            return False, error_msg, "未知"
+        
+        finally:
+            self.waiter.report()
+            get_run_metrics().annotate(
+                self.email,
+                duration=round(time.monotonic() - started, 3),
+                wait_seconds={step: round(seconds, 3) for step, seconds in self.waiter.spent.items()},
+                page_bytes=dict(self.page_bytes),
+            )
+            if self.page_bytes:
+                logger.info(f"📦 页面传输合计 {sum(self.page_bytes.values()) / 1024:.1f} KB")
+            peak_rss, current_rss = get_memory_monitor().unwatch(self._memory_token)
+            if peak_rss:
+                get_run_metrics().annotate(self.email, browser_rss_peak_mb=round(peak_rss / 1024 / 1024, 1))
+            get_selector_stats().save()
+            if self._api_session is not None:
+                self._api_session.close()
+            if self.browser is not None:
+                self.browser.release(crashed=self.driver is not None and not self.browser._alive(), rss=current_rss)
+            elif self.driver:
+                try:
+                    self.driver.quit()
+                except:
+                    pass
+
+class CheckinLedger:
+    """按账号记录每天最后一次成功签到的日期和结果（SQLite），重复运行时只处理今天尚未完成的账号"""
+    
+    def __init__(self, path=None):
+        self.enabled = os.getenv('LEAFLOW_LEDGER', '1').strip() != '0'
+        self.force = os.getenv('LEAFLOW_FORCE', '').strip() == '1'
+        self.path = path or os.getenv('LEAFLOW_LEDGER_PATH') or os.path.join(STATE_DIR, 'ledger.db')
+        self.lock = threading.Lock()
+        self.conn = None
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkins (
+                    account TEXT PRIMARY KEY,
+                    last_success_date TEXT,
+                    last_result TEXT,
+                    last_balance TEXT,
+                    last_attempt_at TEXT,
+                    attempt_date TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                )
+            """)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 签到账本不可用，处理全部账号: {e}")
+            self.enabled = False
+            self.conn = None
+    
+    @staticmethod
+    def today():
+        return local_now().date().isoformat()
+    
+    def completed_today(self, email):
+        """今天已成功时返回 (result, balance)，否则返回None"""
+        if not self.conn:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT last_result, last_balance FROM checkins WHERE account = ? AND last_success_date = ?",
+                (account_key(email), self.today())
+            ).fetchone()
+        return row
+    
+    def partition(self, accounts):
+        """拆分为 (待处理账号, 今日已完成账号的结果)"""
+        if not self.conn or self.force:
+            return list(accounts), []
+        pending, done = [], []
+        for account in accounts:
+            row = self.completed_today(account['email'])
+            if row:
+                done.append((account['email'], True, row[0] or "今日已签到", row[1] or "未知"))
+            else:
+                pending.append(account)
+        return pending, done
+    
+    def record(self, email, success, result, balance):
+        if not self.conn:
+            return
+        now = local_now()
+        today = now.date().isoformat()
+        key = account_key(email)
+        try:
+            with self.lock:
+                self.conn.execute("INSERT OR IGNORE INTO checkins (account) VALUES (?)", (key,))
+                self.conn.execute("""
+                    UPDATE checkins SET
+                        attempts = CASE WHEN attempt_date = ? THEN attempts + 1 ELSE 1 END,
+                        attempt_date = ?,
+                        last_attempt_at = ?
+                    WHERE account = ?
+                """, (today, today, now.isoformat(timespec='seconds'), key))
+                if success:
+                    self.conn.execute(
+                        "UPDATE checkins SET last_success_date = ?, last_result = ?, last_balance = ?, last_error = NULL WHERE account = ?",
+                        (today, result, balance, key)
+                    )
+                else:
+                    self.conn.execute("UPDATE checkins SET last_error = ? WHERE account = ?", (result, key))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"写入签到账本失败: {e}")
+    
+    def close(self):
+        if self.conn:
+            with self.lock:
+                self.conn.close()
+            self.conn = None
+
+
+class RunCheckpoint:
+    """按天追加写入的JSONL结果检查点：每个账号完成后立即写一行（结果、余额、耗时），
+    任务超时或崩溃时已完成的结果不会丢失；--resume 时跳过今天检查点中已成功的账号。
+    文件中只保存账号哈希和脱敏后的邮箱，不保存密码。"""
+    
+    def __init__(self, directory=None):
+        self.enabled = os.getenv('LEAFLOW_CHECKPOINT', '1').strip() != '0'
+        self.directory = directory or os.getenv('LEAFLOW_CHECKPOINT_DIR') or os.path.join(STATE_DIR, 'checkpoints')
+        self.keep_days = max(1, env_number('LEAFLOW_CHECKPOINT_KEEP_DAYS', 7, int))
+        self.run_id = f"{local_now():%H%M%S}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.file = None
+        self.window = None
+    
+    @staticmethod
+    def today():
+        return local_now().date().isoformat()
+    
+    def path_for(self, window=None):
+        return os.path.join(self.directory, f"{window or self.today()}.jsonl")
+    
+    def _open(self, window):
+        """打开（或按日期切换到）当天的检查点文件，写入本次运行的起始行并清理过期文件"""
+        if self.file:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.file = open(self.path_for(window), 'a', encoding='utf-8')
+        self.window = window
+        self._write({'type': 'run', 'run': self.run_id, 'pid': os.getpid(),
+                     'started_at': local_now().isoformat(timespec='seconds')})
+        cutoff = (local_now().date() - timedelta(days=self.keep_days)).isoformat()
+        for name in os.listdir(self.directory):
+            if name.endswith('.jsonl') and name[:-6] < cutoff:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+    
+    def _write(self, entry):
+        # 每行单独写入并刷新，进程被杀时最多丢失正在写的一行
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.file.flush()
+    
+    def record(self, email, success, result, balance, duration=None):
+        if not self.enabled:
+            return
+        now = local_now()
+        entry = {
+            'type': 'result',
+            'run': self.run_id,
+            'account': account_key(email),
+            'label': mask_email(email),
+            'success': bool(success),
+            'result': result,
+            'balance': balance,
+            'duration': duration,
+            'finished_at': now.isoformat(timespec='seconds'),
+        }
+        try:
+            with self.lock:
+                window = now.date().isoformat()
+                if self.window != window:
+                    self._open(window)
+                self._write(entry)
+        except OSError as e:
+            # 之后的汇总改用内存中的结果
+            logger.warning(f"写入结果检查点失败，本次运行不再写入: {e}")
+            self.enabled = False
+    
+    def iter_results(self, window=None):
+        """逐行读取检查点中的结果记录，跳过被截断或损坏的行"""
+        try:
+            f = open(self.path_for(window), encoding='utf-8')
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and entry.get('type') == 'result' and entry.get('account'):
+                    yield entry
+    
+    def collect(self, accounts, run=None):
+        """流式聚合检查点：返回按账号顺序排列的 (email, success, result, balance)，每个账号取最后一条记录。
+        指定 run 时只统计该次运行写入的记录"""
+        by_key = {account_key(a['email']): a['email'] for a in accounts}
+        latest = {}
+        for entry in self.iter_results():
+            email = by_key.get(entry['account'])
+            if email is None or (run is not None and entry.get('run') != run):
+                continue
+            latest[email] = (email, entry.get('success', False), entry.get('result') or "", entry.get('balance') or "未知")
+        return [latest[a['email']] for a in accounts if a['email'] in latest]
+    
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.file = None
+            self.window = None
+
+
+class WorkQueue:
+    """多个运行节点共享的账号队列（SQLite，放在共享卷上）。
+    
+    各节点加载同一份账号列表后写入队列（幂等），再按租约领取账号：领取时设置 lease_until，
+    处理期间后台心跳续租；节点崩溃或卡住导致租约过期后，账号会被其他节点重新领取。
+    失败的账号重新排队，最多尝试 LEAFLOW_QUEUE_ATTEMPTS 次。队列中只保存账号哈希，不保存邮箱和密码。
+    """
+    
+    def __init__(self, path, run_id=None):
+        self.path = path
+        self.run_id = run_id or os.getenv('LEAFLOW_QUEUE_RUN', '').strip() or local_now().date().isoformat()
+        self.lease = max(10.0, env_number('LEAFLOW_QUEUE_LEASE', 300.0))
+        self.max_attempts = max(1, env_number('LEAFLOW_QUEUE_ATTEMPTS', 3, int))
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{os.urandom(3).hex()}"
+        self.restricted = False
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # 共享卷（NFS等）上不使用WAL；每个写操作都在 BEGIN IMMEDIATE 事务中完成
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS queue (
+                run_id TEXT NOT NULL,
+                account TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_until REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                updated_at REAL,
+                PRIMARY KEY (run_id, account)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS queue_status ON queue (run_id, status, lease_until)")
+    
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+    
+    def seed(self, accounts, done=()):
+        """写入本次运行的全部账号（已存在的不变），done 中的账号标记为已完成。
+        同一 run_id 的上一次运行已经结束（没有待处理和进行中的账号）时，失败的账号重新排队"""
+        now = time.time()
+        with self.transaction() as conn:
+            active = conn.execute(
+                "SELECT COUNT(*) FROM queue WHERE run_id = ? AND status IN ('pending', 'leased')", (self.run_id,)
+            ).fetchone()[0]
+            reset = 0
+            if not active:
+                reset = conn.execute(
+                    "UPDATE queue SET status = 'pending', attempts = 0, owner = NULL, lease_until = 0, updated_at = ? "
+                    "WHERE run_id = ? AND status = 'failed'",
+                    (now, self.run_id)
+                ).rowcount
+            conn.executemany(
+                "INSERT OR IGNORE INTO queue (run_id, account, position, updated_at) VALUES (?, ?, ?, ?)",
+                [(self.run_id, account_key(a['email']), i, now) for i, a in enumerate(accounts)]
+            )
+            conn.executemany(
+                "UPDATE queue SET status = 'done', result = ?, updated_at = ? WHERE run_id = ? AND account = ? AND status != 'done'",
+                [(result, now, self.run_id, account_key(email)) for email, result in done]
+            )
+        if reset:
+            logger.info(f"🌐 上次运行失败的 {reset} 个账号重新排队")
+    
+    def restrict(self, keys):
+        """只领取 keys 中的账号（本节点账号列表中的账号）。
+        其他节点的账号不会被本节点租用，也就不需要领取后再归还"""
+        with self.lock:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS claimable (account TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM temp.claimable")
+            self.conn.executemany("INSERT OR IGNORE INTO temp.claimable (account) VALUES (?)", [(key,) for key in keys])
+            self.restricted = True
+    
+    def claim(self, limit=1):
+        """领取待处理或租约已过期的账号，返回账号哈希列表"""
+        now = time.time()
+        own = " AND account IN (SELECT account FROM temp.claimable)" if self.restricted else ""
+        with self.transaction() as conn:
+            # 租约过期且尝试次数已用完的账号不会再被领取，直接标记为失败
+            conn.execute(
+                "UPDATE queue SET status = 'failed', owner = NULL, result = COALESCE(result, '租约过期'), updated_at = ? "
+                "WHERE run_id = ? AND status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.run_id, now, self.max_attempts)
+            )
+            rows = conn.execute(
+                "SELECT account FROM queue WHERE run_id = ? AND attempts < ? "
+                "AND (status = 'pending' OR (status = 'leased' AND lease_until < ?))" + own +
+                " ORDER BY attempts, position LIMIT ?",
+                (self.run_id, self.max_attempts, now, limit)
+            ).fetchall()
+            keys = [row[0] for row in rows]
+            conn.executemany(
+                "UPDATE queue SET status = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE run_id = ? AND account = ?",
+                [(self.owner, now + self.lease, now, self.run_id, key) for key in keys]
+            )
+        return keys
+    
+    def heartbeat(self):
+        """为本节点持有的全部租约续期"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE queue SET lease_until = ? WHERE run_id = ? AND owner = ? AND status = 'leased'",
+                (now + self.lease, self.run_id, self.owner)
+            )
+    
+    def complete(self, key, success, result):
+        """成功标记为 done；失败时还有尝试次数则重新排队，否则标记为 failed。
+        只更新本节点仍持有租约的账号；租约已过期并被其他节点接手时返回False，不覆盖对方的状态"""
+        now = time.time()
+        with self.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE queue SET status = CASE WHEN ? THEN 'done' WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_until = 0, result = ?, updated_at = ? "
+                "WHERE run_id = ? AND account = ? AND owner = ? AND status = 'leased'",
+                (1 if success else 0, self.max_attempts, result, now, self.run_id, key, self.owner)
+            ).rowcount
+        if not updated:
+            logger.warning(f"⚠️ 账号 {key[:6]} 的租约已过期并被其他节点接手，本节点结果不写入队列")
+        return bool(updated)
+    
+    def outstanding(self, keys):
+        """keys 中仍待处理或被（任一节点）持有租约的账号数；其他账号由别的节点负责，不需要等待"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT account FROM queue WHERE run_id = ? AND (status = 'leased' OR (status = 'pending' AND attempts < ?))",
+                (self.run_id, self.max_attempts)
+            ).fetchall()
+        return sum(1 for (key,) in rows if key in keys)
+    
+    def statuses(self):
+        """本次运行全部账号的状态 {账号哈希: status}"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT account, status FROM queue WHERE run_id = ?", (self.run_id,)).fetchall())
+    
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM queue WHERE run_id = ? GROUP BY status", (self.run_id,)
+            ).fetchall()
+        return dict(rows)
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def format_result_block(email, success, result, balance):
+    """单个账号的通知内容（HTML parse_mode，结果文本需转义）"""
+    masked_email = html.escape(mask_email(email))
+    if success:
+        return f"账号：{masked_email}\n✅  {html.escape(str(result))}！\n💰  当前总余额：{html.escape(str(balance))}。\n\n"
+    return f"账号：{masked_email}\n❌  {html.escape(str(result))}\n\n"
+
+
+def telegram_length(text):
+    """Telegram按UTF-16代码单元计算长度，emoji占2个"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def chunk_message(header, blocks, limit=4096):
+    """把消息拆成不超过 limit 的若干条：账号块不跨消息拆分，后续消息标注（续）"""
+    chunks = []
+    current = header
+    for block in blocks:
+        if telegram_length(block) > limit - 100:
+            block = block[:(limit - 100) // 2]
+            # 块内容已转义：不能截断在实体中间（如 "&lt"），否则 HTML parse_mode 会被 Telegram 拒绝
+            if block.rfind('&') > block.rfind(';'):
+                block = block[:block.rfind('&')]
+            block += "…\n\n"
+        if telegram_length(current) + telegram_length(block) > limit - 20:
+            chunks.append(current)
+            current = ""
+        current += block
+    if current or not chunks:
+        chunks.append(current)
+    if len(chunks) > 1:
+        chunks = [f"{chunk}（{i}/{len(chunks)}）" if i == 1 else f"（续 {i}/{len(chunks)}）\n{chunk}"
+                  for i, chunk in enumerate(chunks, 1)]
+    return chunks
+
+
+class NotificationError(Exception):
+    """通知渠道返回了不可重试的错误"""
+
+
+def raise_for_notify_status(response):
+    """把通知渠道的响应转换为可分类的异常，交给 notification 重试策略处理"""
+    if response.status_code == 429:
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        try:
+            retry_after = retry_after or parse_retry_after(response.json().get('parameters', {}).get('retry_after'))
+        except ValueError:
+            pass
+        raise HttpThrottledError("通知渠道限流 (HTTP 429)", retry_after)
+    if response.status_code >= 500:
+        raise HttpTransientError(f"通知渠道服务端错误 (HTTP {response.status_code})")
+    if response.status_code >= 400:
+        raise NotificationError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+class TelegramSink:
+    """Telegram 机器人通知，按 4096 字符拆分消息"""
+    
+    name = 'telegram'
+    
+    def __init__(self, token, chat_id, session):
+        api = os.getenv('LEAFLOW_TELEGRAM_API', 'https://api.telegram.org').rstrip('/')
+        self.url = f"{api}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.session = session
+    
+    def send(self, header, blocks, results):
+        for chunk in chunk_message(header, blocks):
+            get_retry_policy('notification').call(self._post, chunk)
+    
+    def _post(self, text):
+        response = self.session.post(self.url, data={
+            "chat_id": self.chat_id,
+            "text": text,
+            "parse_mode": "HTML"
+        }, timeout=10)
+        raise_for_notify_status(response)
+
+
+class WebhookSink:
+    """通用Webhook：POST JSON，包含完整文本和结构化的账号结果"""
+    
+    name = 'webhook'
+    
+    def __init__(self, url, session):
+        self.url = url
+        self.session = session
+    
+    def send(self, header, blocks, results):
+        payload = {
+            'text': header + ''.join(blocks),
+            'results': [
+                {'account': mask_email(email), 'success': success, 'result': result, 'balance': balance}
+                for email, success, result, balance in results
+            ],
+        }
+        get_retry_policy('notification').call(self._post, payload)
+    
+    def _post(self, payload):
+        raise_for_notify_status(self.session.post(self.url, json=payload, timeout=10))
+
+
+class FileSink:
+    """把每条通知追加写入JSONL文件，便于本地查看或由其他程序消费"""
+    
+    name = 'file'
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+    
+    def send(self, header, blocks, results):
+        entry = {
+            'time': local_now().isoformat(timespec='seconds'),
+            'text': header + ''.join(blocks),
+            'results': [
+                {'account': mask_email(email), 'success': success, 'result': result, 'balance': balance}
+                for email, success, result, balance in results
+            ],
+        }
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+class Notifier:
+    """通知管道：汇总按大小拆分后发送到所有渠道（Telegram / Webhook / 文件）。
+    
+    LEAFLOW_NOTIFY_STREAM=1 时账号完成后即进入后台队列，攒满 LEAFLOW_NOTIFY_BATCH 个或
+    超过 LEAFLOW_NOTIFY_INTERVAL 秒就发送一次进度，最终汇总只包含统计和失败的账号。
+    """
+    
+    def __init__(self, telegram_token='', telegram_chat_id=''):
+        self.session = create_http_session()
+        self.sinks = []
+        if telegram_token and telegram_chat_id:
+            self.sinks.append(TelegramSink(telegram_token, telegram_chat_id, self.session))
+        webhook = os.getenv('LEAFLOW_WEBHOOK_URL', '').strip()
+        if webhook:
+            self.sinks.append(WebhookSink(webhook, self.session))
+        notify_file = os.getenv('LEAFLOW_NOTIFY_FILE', '').strip()
+        if notify_file:
+            self.sinks.append(FileSink(notify_file))
         
-        # 等待签到页面加载（最多重试5次，每次等待30秒）
-        if not self.wait_for_checkin_page_loaded(max_retries=5, wait_time=30):
-            logger.warning("UI签到页面加载失败，尝试API签到...")
-            
-            # 尝试API签到作为备用方案
-            api_result = self.checkin_via_api()
-            if api_result:
-                return "API签到成功"
-            
-            raise Exception("签到页面加载失败，UI和API方式都无法签到")
+        self.stream = bool(self.sinks) and os.getenv('LEAFLOW_NOTIFY_STREAM', '').strip() == '1'
+        self.batch_size = max(1, env_number('LEAFLOW_NOTIFY_BATCH', 20, int))
+        self.interval = env_number('LEAFLOW_NOTIFY_INTERVAL', 30.0)
+        self.queue = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+    
+    def deliver(self, header, results):
+        """发送到所有渠道，单个渠道失败不影响其他渠道"""
+        blocks = [format_result_block(*r) for r in results]
+        for sink in self.sinks:
+            try:
+                sink.send(header, blocks, results)
+                logger.info(f"✅ {sink.name} 通知发送成功")
+            except Exception as e:
+                logger.error(f"❌ {sink.name} 通知发送失败: {e}")
+    
+    def publish(self, result):
+        """账号完成后调用；未开启增量通知时忽略"""
+        if not self.stream:
+            return
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, name="notifier", daemon=True)
+                self.worker.start()
+        self.queue.put(result)
+    
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, threading.Event):
+                self._send_progress(pending)
+                pending = []
+                deadline = None
+                item.set()
+                continue
+            if item is not None:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.interval
+            if pending and (item is None or len(pending) >= self.batch_size):
+                self._send_progress(pending)
+                pending = []
+                deadline = None
+    
+    def _send_progress(self, results):
+        if not results:
+            return
+        success_count = sum(1 for _, success, _, _ in results if success)
+        self.deliver(f"🎁 Leaflow签到进度\n📊 本批成功: {success_count}/{len(results)}\n\n", results)
+    
+    def flush(self, timeout=60):
+        """等待后台队列中的结果发送完毕"""
+        if self.worker is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+    
+    def send_summary(self, results):
+        if not self.sinks:
+            logger.info("未配置通知渠道，跳过通知")
+            return
+        self.flush()
+        success_count = sum(1 for _, success, _, _ in results if success)
+        current_date = datetime.now().strftime("%Y/%m/%d")
+        header = f"🎁 Leaflow自动签到通知\n"
+        header += f"📊 成功: {success_count}/{len(results)}\n"
+        header += f"📅 签到时间：{current_date}\n\n"
+        # 增量通知已经发送过每个账号的结果，汇总只列出失败的账号
+        listed = [r for r in results if not r[1]] if self.stream else results
+        self.deliver(header, listed)
+
+
+class AsyncCheckinRunner:
+    """asyncio 调度核心。
+    
+    所有账号的HTTP步骤在事件循环中并发推进，每一步按目标主机限制并发数并在一个小线程池中执行
+    （共享 _HTTP_ADAPTER 连接池）；需要浏览器的账号交给 manager.workers 个浏览器线程。
+    几百个账号也只占用少量线程。
+    """
+    
+    def __init__(self, manager):
+        self.manager = manager
+        self.per_host = max(1, env_number('LEAFLOW_ASYNC_PER_HOST', 4, int))
+        self.max_accounts = max(1, env_number('LEAFLOW_ASYNC_CONCURRENCY', 50, int))
+        self.http_executor = None
+        self.browser_executor = None
+        self.host_limits = {}
+    
+    def run(self, accounts):
+        return asyncio.run(self.run_async(accounts))
+    
+    async def run_async(self, accounts):
+        # 信号量需在事件循环内创建
+        self.host_limits = {}
+        account_limit = asyncio.Semaphore(self.max_accounts)
+        self.http_executor = ThreadPoolExecutor(max_workers=self.per_host * 2, thread_name_prefix="http")
+        self.browser_executor = ThreadPoolExecutor(max_workers=self.manager.workers, thread_name_prefix="browser")
+        logger.info(f"⚡ asyncio模式: 每个主机并发 {self.per_host}，浏览器线程 {self.manager.workers}")
         
-        # 查找并点击签到按钮
-        checkin_result = self.find_and_click_checkin_button()
+        async def guarded(index, account):
+            async with account_limit:
+                return await self.run_account(index, account)
         
-        if checkin_result == "already_checked_in":
-            return "今日已签到"
-        elif checkin_result is True:
-            logger.info("已点击签到按钮")
-            time.sleep(5)  # 等待签到结果
-            
-            # 获取签到结果
-            result_message = self.get_checkin_result()
-            return result_message
-        else:
-            # 最后尝试API签到
-            logger.warning("无法点击签到按钮，尝试API签到...")
-            api_result = self.checkin_via_api()
-            if api_result:
-                return "API签到成功"
-            
-            raise Exception("找不到签到按钮或按钮不可点击，且API签到也失败")
+        try:
+            results = list(await asyncio.gather(*(guarded(i, a) for i, a in enumerate(accounts, 1))))
+            await self.notify(results)
+        finally:
+            self.http_executor.shutdown(wait=False)
+            # 浏览器线程各自持有的浏览器由 manager.close_browsers 统一关闭
+            await asyncio.get_running_loop().run_in_executor(None, self.browser_executor.shutdown)
+        return results
     
-    def get_checkin_result(self):
-        """获取签到结果消息"""
+    def _host_limit(self, host):
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self.host_limits[host]
+    
+    async def call_http(self, host, func, *args):
+        """在HTTP线程池中执行一次阻塞请求，受目标主机并发限制"""
+        async with self._host_limit(host):
+            return await asyncio.get_running_loop().run_in_executor(self.http_executor, func, *args)
+    
+    async def call_with_retry(self, host, step, record):
+        """按 http_step 策略重试，退避期间不占用线程"""
+        policy = get_retry_policy('http_step')
+        attempt = 0
+        while True:
+            try:
+                return await self.call_http(host, step)
+            except Exception as e:
+                delay = policy.backoff(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                record['attempts'] = attempt + 1
+                logger.warning(f"{classify_failure(e)} 失败，{delay:.1f}秒后第 {attempt + 1}/{policy.attempts} 次尝试: {e}")
+                await asyncio.sleep(delay)
+    
+    async def run_http(self, auto_checkin):
+        client = LeaflowHttpClient(auto_checkin.email, auto_checkin.password)
         try:
-            # 给页面一些时间显示结果
-            time.sleep(3)
-            
-            # 尝试查找各种可能的成功消息元素
-            success_selectors = [
-                ".alert-success",
-                ".success",
-                ".message",
-                "[class*='success']",
-                "[class*='message']",
-                ".modal-content",  # 弹窗内容
-                ".ant-message",    # Ant Design 消息
-                ".el-message",     # Element UI 消息
-                ".toast",          # Toast消息
-                ".notification"    # 通知
-            ]
-            
-            for selector in success_selectors:
+            steps = auto_checkin.http_steps(client)
+            value = None
+            while True:
                 try:
-                    element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                    if element.is_displayed():
-                        text = element.text.strip()
-                        if text:
-                            logger.info(f"找到签到结果消息: {text}")
-                            return text
-                except:
-                    continue
-            
-            # 如果没有找到特定元素，检查页面文本
-            page_text = self.driver.find_element(By.TAG_NAME, "body").text
-            important_keywords = ["成功", "签到", "获得", "恭喜", "谢谢", "感谢", "完成", "已签到", "连续签到"]
-            
-            for keyword in important_keywords:
-                if keyword in page_text:
-                    # 提取包含关键词的行
-                    lines = page_text.split('\n')
-                    for line in lines:
-                        if keyword in line and len(line.strip()) < 100:  # 避免提取过长的文本
-                            logger.info(f"从页面文本找到结果: {line.strip()}")
-                            return line.strip()
-            
-            # 检查签到按钮状态变化
-            try:
-                checkin_btn = self.driver.find_element(By.CSS_SELECTOR, "button.checkin-btn")
-                if not checkin_btn.is_enabled() or "已签到" in checkin_btn.text or "disabled" in checkin_btn.get_attribute("class"):
-                    return "签到完成"
-            except:
-                pass
-            
-            return "签到完成，但未找到具体结果消息"
-            
+                    host, step = steps.send(value)
+                except StopIteration as stop:
+                    result, balance = stop.value
+                    return True, result, balance
+                with get_run_metrics().span(auto_checkin.email, HTTP_STEP_PHASES.get(step.__name__, step.__name__), engine='http') as record:
+                    value = await self.call_with_retry(host, step, record)
         except Exception as e:
-            return f"获取签到结果时出错: {str(e)}"
+            return auto_checkin.http_failure(e)
+        finally:
+            client.close()
+    
+    def _run_browser(self, account):
+        auto_checkin = LeaflowAutoCheckin(account['email'], account['password'], browser=self.manager._thread_browser())
+        return auto_checkin.run(skip_http=True)
     
-    def run(self):
-        """单个账号执行流程"""
+    async def run_account(self, index, account):
+        email = account['email']
+        started = time.monotonic()
         try:
-            logger.info(f"开始处理账号: {self.email[:3]}***{self.email[self.email.find('@'):]}")
-            
-            # 登录
-            if self.login():
-                # 签到
-                result = self.checkin()
-                
-                # 获取余额
-                balance = self.get_balance()
-                
-                logger.info(f"✅ 签到结果: {result}, 余额: {balance}")
-                return True, result, balance
-            else:
-                raise Exception("登录失败")
-                
+            auto_checkin = LeaflowAutoCheckin(email, account['password'])
+            outcome = None
+            if auto_checkin.http_first:
+                logger.info(f"[{index}] 开始处理账号: {mask_email(email)}")
+                outcome = await self.run_http(auto_checkin)
+            if outcome is None:
+                outcome = await asyncio.get_running_loop().run_in_executor(
+                    self.browser_executor, self._run_browser, account
+                )
+            success, result, balance = outcome
         except Exception as e:
-            error_msg = f"自动签到失败: {str(e)}"
-            logger.error(f"❌ {error_msg}")
-            return False, error_msg, "未知"
-        
+            success, result, balance = False, f"处理账号时发生异常: {str(e)}", "未知"
+            logger.error(f"❌ {result}")
         finally:
-            if self.driver:
-                try:
-                    self.driver.quit()
-                except:
-                    pass
+            duration = round(time.monotonic() - started, 3)
+            get_run_metrics().annotate(email, duration=duration)
+        self.manager.record_result(email, success, result, balance, duration=duration)
+        return email, success, result, balance
+    
+    async def notify(self, results):
+        """通知同样不阻塞事件循环"""
+        await self.call_http('api.telegram.org', self.manager.send_notification, self.manager.merge_results(results))
+
+
+def parse_shard(value):
+    """解析 i/n 形式的分片参数（i 从0开始），为空时返回None"""
+    if not value:
+        return None
+    try:
+        index, count = [int(part) for part in str(value).split('/', 1)]
+    except ValueError:
+        raise ValueError(f"分片格式错误: {value}，应为 i/n，如 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片超出范围: {value}，要求 0 <= i < n")
+    return index, count
+
+
+def in_shard(email, shard):
+    """按邮箱哈希稳定分片：同一账号在任何机器、任何顺序下都落在同一分片"""
+    if shard is None:
+        return True
+    index, count = shard
+    return int(account_key(email), 16) % count == index
+
+
+ACCOUNT_LOGIN = re.compile(r'\s*([^\s,:]+):')
+
+
+def split_account_pairs(text):
+    """拆分 LEAFLOW_ACCOUNTS：换行总是分隔账号；逗号后紧跟"账号:"时开始新账号。
+    邮箱账号的密码中可以包含逗号，只有后面紧跟"邮箱:"时才拆分；用户名账号按逗号直接拆分"""
+    pairs = []
+    for line in text.strip().splitlines():
+        # 行尾的逗号只是分隔符
+        for i, piece in enumerate(line.rstrip().rstrip(',').split(',')):
+            match = ACCOUNT_LOGIN.match(piece)
+            previous = pairs[-1].split(':', 1)[0] if pairs else ''
+            if i == 0 or (match and ('@' in match.group(1) or '@' not in previous)):
+                pairs.append(piece)
+                continue
+            if match:
+                logger.warning(f"账号 {mask_email(previous)} 的密码中包含 ',{match.group(1)}:'，按密码的一部分处理；"
+                               f"如果是两个账号，请换行分隔")
+            pairs[-1] += ',' + piece
+    return [pair.strip() for pair in pairs if pair.strip()]
+
+
+def _iter_json_array(f, chunk_size=65536):
+    """逐个解码顶层JSON数组中的元素，不把整个文件读入内存"""
+    decoder = json.JSONDecoder()
+    # 跳过开头的空白（可能比一个块还长）
+    buffer = ''
+    while not buffer:
+        more = f.read(chunk_size)
+        if not more:
+            break
+        buffer = more.lstrip()
+    if not buffer.startswith('['):
+        # 不是数组（如 {"accounts": [...]}），退回整体解析
+        data = json.loads(buffer + f.read())
+        yield from (data.get('accounts', []) if isinstance(data, dict) else [])
+        return
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+            # 解码到缓冲区末尾时元素可能还没读完（如数字被分块截断），读入更多后重新解码
+            if end == len(buffer) and not eof:
+                raise ValueError("元素可能不完整")
+        except ValueError:
+            if eof:
+                raise
+            more = f.read(chunk_size)
+            eof = not more
+            buffer += more
+            continue
+        yield item
+        buffer = buffer[end:]
+        if not buffer and not eof:
+            more = f.read(chunk_size)
+            eof = not more
+            buffer = more
+
+
+def _account_from_record(record):
+    """从JSON对象或CSV行中取邮箱和密码（字段名不区分大小写，兼容 username/user/pass）"""
+    if not isinstance(record, dict):
+        return None
+    fields = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+    email = next((fields[k] for k in ('email', 'username', 'user', 'account') if fields.get(k)), '')
+    password = next((fields[k] for k in ('password', 'pass', 'passwd') if fields.get(k)), '')
+    email, password = str(email).strip(), str(password).strip()
+    if email and password:
+        return {'email': email, 'password': password}
+    return None
+
+
+def iter_account_file(path):
+    """按扩展名流式读取账号文件：.json（数组或 {"accounts": [...]}）、.jsonl/.ndjson、.csv（带表头），
+    其他扩展名按每行一个 邮箱:密码 解析。逐条产出 (序号, 账号或None)，None 表示该条格式错误"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if ext == '.json':
+            for n, record in enumerate(_iter_json_array(f), 1):
+                yield n, _account_from_record(record)
+        elif ext in ('.jsonl', '.ndjson'):
+            for n, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield n, _account_from_record(json.loads(line))
+                    except ValueError:
+                        yield n, None
+        elif ext == '.csv':
+            for n, row in enumerate(csv.DictReader(f), 2):
+                yield n, _account_from_record(row)
+        else:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                email, _, password = line.partition(':')
+                yield n, ({'email': email.strip(), 'password': password.strip()}
+                          if email.strip() and password.strip() else None)
+
 
 class MultiAccountManager:
     """多账号管理器 - 简化配置版本"""
     
-    def __init__(self):
+    def __init__(self, shard=None, resume=False):
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
         self.telegram_chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
+        self.shard = parse_shard(shard or os.getenv('LEAFLOW_SHARD', '').strip())
         self.accounts = self.load_accounts()
+        self.workers = self.load_workers()
+        # 每个工作线程持有一个可复用的浏览器
+        self.reuse_browser = os.getenv('LEAFLOW_BROWSER_REUSE', '1').strip() != '0'
+        self.use_async = os.getenv('LEAFLOW_ASYNC', '').strip() == '1'
+        self.ledger = CheckinLedger()
+        self.checkpoint = RunCheckpoint()
+        self.resume = resume or os.getenv('LEAFLOW_RESUME', '').strip() == '1'
+        self.notifier = Notifier(self.telegram_bot_token, self.telegram_chat_id)
+        queue_path = os.getenv('LEAFLOW_QUEUE_PATH', '').strip()
+        self.work_queue = WorkQueue(queue_path) if queue_path else None
+        self.queue_status = {}
+        self.total = len(self.accounts)
+        self.skipped_results = []
+        self._local = threading.local()
+        self._browsers = []
+        self._browsers_lock = threading.Lock()
+    
+    def load_workers(self):
+        """读取并发工作线程数 LEAFLOW_WORKERS，默认1（串行）"""
+        value = os.getenv('LEAFLOW_WORKERS', '').strip()
+        if not value:
+            return 1
+        try:
+            workers = int(value)
+        except ValueError:
+            logger.warning(f"⚠️ LEAFLOW_WORKERS 无效: {value}，使用串行模式")
+            return 1
+        return max(1, workers)
     
     def load_accounts(self):
-        """从环境变量加载多账号信息，支持冒号分隔多账号和单账号"""
-        accounts = []
-        
+        """加载多账号信息：账号文件、冒号分隔多账号或单账号，并按 --shard 只保留本分片的账号"""
         logger.info("开始加载账号配置...")
+        if self.shard:
+            logger.info(f"🧩 分片 {self.shard[0]}/{self.shard[1]}：只处理哈希落在本分片的账号")
+        
+        # 方法0: 账号文件（JSON/JSONL/CSV/每行 邮箱:密码），逐条读取
+        accounts_file = os.getenv('LEAFLOW_ACCOUNTS_FILE', '').strip()
+        if accounts_file:
+            accounts, total = self._collect(iter_account_file(accounts_file), "账号文件第 {} 条")
+            if total:
+                logger.info(f"从账号文件 {os.path.basename(accounts_file)} 加载了 {len(accounts)}/{total} 个账号")
+                return accounts
+            logger.warning("账号文件中没有找到有效的账号信息")
         
-        # 方法1: 冒号分隔多账号格式
+        # 方法1: 冒号分隔多账号格式（逗号或换行分隔，密码中可以包含逗号）
         accounts_str = os.getenv('LEAFLOW_ACCOUNTS', '').strip()
         if accounts_str:
-            try:
-                logger.info("尝试解析冒号分隔多账号配置")
-                account_pairs = [pair.strip() for pair in accounts_str.split(',')]
-                
-                logger.info(f"找到 {len(account_pairs)} 个账号配置")
-                
-                for i, pair in enumerate(account_pairs):
-                    if ':' in pair:
-                        email, password = pair.split(':', 1)
-                        email = email.strip()
-                        password = password.strip()
-                        
-                        if email and password:
-                            accounts.append({
-                                'email': email,
-                                'password': password
-                            })
-                            logger.info(f"✅ 成功添加第 {i+1} 个账号")
-                        else:
-                            logger.warning(f"⚠️ 账号对 {i+1} 格式错误")
-                    else:
-                        logger.warning(f"⚠️ 账号对 {i+1} 缺少冒号分隔符")
-                
-                if accounts:
-                    logger.info(f"从冒号分隔格式成功加载了 {len(accounts)} 个账号")
-                    return accounts
-                else:
-                    logger.warning("冒号分隔配置中没有找到有效的账号信息")
-            except Exception as e:
-                logger.error(f"解析冒号分隔账号配置失败: {e}")
+            logger.info("尝试解析冒号分隔多账号配置")
+            pairs = split_account_pairs(accounts_str)
+            logger.info(f"找到 {len(pairs)} 个账号配置")
+            entries = []
+            for n, pair in enumerate(pairs, 1):
+                email, _, password = pair.partition(':')
+                entries.append((n, {'email': email.strip(), 'password': password.strip()}
+                                if email.strip() and password.strip() else None))
+            accounts, total = self._collect(entries, "账号对 {}")
+            if total:
+                logger.info(f"从冒号分隔格式成功加载了 {len(accounts)}/{total} 个账号")
+                return accounts
+            logger.warning("冒号分隔配置中没有找到有效的账号信息")
         
         # 方法2: 单账号格式
         single_email = os.getenv('LEAFLOW_EMAIL', '').strip()
         single_password = os.getenv('LEAFLOW_PASSWORD', '').strip()
         
         if single_email and single_password:
-            accounts.append({
-                'email': single_email,
-                'password': single_password
-            })
             logger.info("✅ 加载了单个账号配置")
-            return accounts
+            return [{'email': single_email, 'password': single_password}] if in_shard(single_email, self.shard) else []
         
         # 如果所有方法都失败
         logger.error("❌ 未找到有效的账号配置")
@@ -763,110 +3865,623 @@ class MultiAccountManager:
         
         raise ValueError("未找到有效的账号配置")
     
+    def _collect(self, entries, label):
+        """过滤格式错误、重复和不属于本分片的账号；entries 为 (序号, 账号或None) 的迭代器。
+        返回 (本分片账号, 全部有效账号数)"""
+        accounts, seen, duplicates = [], set(), 0
+        for n, account in entries:
+            if account is None:
+                logger.warning(f"⚠️ {label.format(n)} 格式错误")
+                continue
+            key = account_key(account['email'])
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            if in_shard(account['email'], self.shard):
+                accounts.append(account)
+        if duplicates:
+            logger.warning(f"⚠️ 忽略了 {duplicates} 个重复账号")
+        return accounts, len(seen)
+    
     def send_notification(self, results):
-        """发送汇总通知到Telegram - 按照指定模板格式"""
-        if not self.telegram_bot_token or not self.telegram_chat_id:
-            logger.info("Telegram配置未设置，跳过通知")
-            return
+        """发送汇总通知（记录为 notification 阶段）"""
+        with get_run_metrics().span(None, 'notification', engine='http'):
+            self.notifier.send_summary(results)
+    
+    def _thread_browser(self):
+        """当前工作线程的浏览器生命周期管理器（按需创建）"""
+        if not self.reuse_browser:
+            return None
+        browser = getattr(self._local, 'browser', None)
+        if browser is None:
+            browser = BrowserLifecycle()
+            self._local.browser = browser
+            with self._browsers_lock:
+                self._browsers.append(browser)
+        return browser
+    
+    def close_browsers(self):
+        with self._browsers_lock:
+            browsers, self._browsers = self._browsers, []
+        for browser in browsers:
+            browser.close()
+        self._local = threading.local()
+    
+    def _run_account(self, index, account, browser=None):
+        """处理单个账号，返回 (email, success, result, balance)，结果立即写入签到账本"""
+        logger.info(f"{'='*60}")
+        logger.info(f"处理第 {index}/{self.total} 个账号")
+        logger.info(f"{'='*60}")
         
+        started = time.monotonic()
         try:
-            # 构建通知消息
-            success_count = sum(1 for _, success, _, _ in results if success)
-            total_count = len(results)
-            current_date = datetime.now().strftime("%Y/%m/%d")
-            
-            message = f"🎁 Leaflow自动签到通知\n"
-            message += f"📊 成功: {success_count}/{total_count}\n"
-            message += f"📅 签到时间：{current_date}\n\n"
-            
-            for email, success, result, balance in results:
-                # 隐藏邮箱部分字符以保护隐私
-                masked_email = email[:3] + "***" + email[email.find("@"):]
-                
-                if success:
-                    status = "✅"
-                    message += f"账号：{masked_email}\n"
-                    message += f"{status}  {result}！\n"
-                    message += f"💰  当前总余额：{balance}。\n\n"
-                else:
-                    status = "❌"
-                    message += f"账号：{masked_email}\n"
-                    message += f"{status}  {result}\n\n"
-            
-            url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-            data = {
-                "chat_id": self.telegram_chat_id,
-                "text": message,
-                "parse_mode": "HTML"
-            }
-            
-            response = requests.post(url, data=data, timeout=10)
-            if response.status_code == 200:
-                logger.info("✅ Telegram汇总通知发送成功")
-            else:
-                logger.error(f"❌ Telegram通知发送失败: {response.text}")
-                
+            auto_checkin = LeaflowAutoCheckin(account['email'], account['password'], browser=browser or self._thread_browser())
+            success, result, balance = auto_checkin.run()
         except Exception as e:
-            logger.error(f"发送Telegram通知时出错: {e}")
+            success, result, balance = False, f"处理账号时发生异常: {str(e)}", "未知"
+            logger.error(f"❌ {result}")
+        self.record_result(account['email'], success, result, balance, duration=round(time.monotonic() - started, 3))
+        return account['email'], success, result, balance
+    
+    def record_result(self, email, success, result, balance, duration=None):
+        """账号完成后立即写入签到账本和结果检查点，并交给通知管道"""
+        self.ledger.record(email, success, result, balance)
+        self.checkpoint.record(email, success, result, balance, duration)
+        self.notifier.publish((email, success, result, balance))
+    
+    def merge_results(self, results):
+        """合并签到账本中今日已完成的账号、--resume 恢复的结果和本次处理的结果，按账号配置顺序排列"""
+        by_email = {r[0]: r for r in self.skipped_results}
+        by_email.update({r[0]: r for r in results})
+        return [by_email[a['email']] for a in self.accounts if a['email'] in by_email]
     
     def run_all(self):
         """运行所有账号的签到流程"""
-        logger.info(f"🚀 开始执行 {len(self.accounts)} 个账号的签到任务")
+        if not self.accounts:
+            logger.info("本分片没有需要处理的账号")
+            self.ledger.close()
+            return True, []
         
-        results = []
+        accounts, self.skipped_results = self.ledger.partition(self.accounts)
+        if self.skipped_results:
+            logger.info(f"📒 签到账本显示 {len(self.skipped_results)} 个账号今日已完成，跳过")
+        if self.resume and accounts:
+            # 只跳过检查点中最后一次结果为成功的账号，失败的账号重新尝试
+            resumed = [r for r in self.checkpoint.collect(accounts) if r[1]]
+            if resumed:
+                done = {r[0] for r in resumed}
+                accounts = [a for a in accounts if a['email'] not in done]
+                self.skipped_results += resumed
+                logger.info(f"⏯️ 从结果检查点恢复 {len(resumed)} 个账号今天已成功的结果，跳过")
+        if self.work_queue:
+            # 账本中已完成和从检查点恢复的账号都不再进入队列
+            self.work_queue.seed(self.accounts, done=[(r[0], r[2]) for r in self.skipped_results])
+        if not accounts:
+            logger.info("🎉 所有账号今日均已处理，无需执行")
+            get_startup_profile().log_summary()
+            self.ledger.close()
+            if self.work_queue:
+                self.work_queue.close()
+            results = self.merge_results([])
+            return not self.unfinished_accounts(results), results
         
-        for i, account in enumerate(self.accounts, 1):
-            logger.info(f"{'='*60}")
-            logger.info(f"处理第 {i}/{len(self.accounts)} 个账号")
-            logger.info(f"{'='*60}")
-            
-            try:
-                auto_checkin = LeaflowAutoCheckin(account['email'], account['password'])
-                success, result, balance = auto_checkin.run()
-                results.append((account['email'], success, result, balance))
-                
-                # 在账号之间添加间隔，避免请求过于频繁
-                if i < len(self.accounts):
-                    wait_time = 5
-                    logger.info(f"⏳ 等待{wait_time}秒后处理下一个账号...")
-                    time.sleep(wait_time)
+        self.total = len(accounts)
+        logger.info(f"🚀 开始执行 {len(accounts)} 个账号的签到任务")
+        
+        get_memory_monitor().start()
+        try:
+            if self.work_queue:
+                results = self.run_distributed(accounts)
+            elif self.use_async:
+                # asyncio模式在事件循环内发送通知
+                results = AsyncCheckinRunner(self).run(accounts)
+            elif self.workers > 1 and len(accounts) > 1:
+                results = self.run_concurrent(accounts)
+            else:
+                results = []
+                # 请求频率由按主机的限速器控制，账号之间默认不再固定等待
+                interval = env_number('LEAFLOW_ACCOUNT_INTERVAL', 0.0)
+                for i, account in enumerate(accounts, 1):
+                    results.append(self._run_account(i, account))
                     
-            except Exception as e:
-                error_msg = f"处理账号时发生异常: {str(e)}"
-                logger.error(f"❌ {error_msg}")
-                results.append((account['email'], False, error_msg, "未知"))
+                    if interval > 0 and i < len(accounts):
+                        logger.info(f"⏳ 等待{interval}秒后处理下一个账号...")
+                        time.sleep(interval)
+        finally:
+            self.close_browsers()
+            self.ledger.close()
+            self.checkpoint.close()
+            get_debug_capture().flush()
+            get_memory_monitor().stop()
+        
+        # 汇总以检查点为准（逐行读取）；检查点不可用时使用内存中的结果
+        if self.checkpoint.enabled:
+            results = self.checkpoint.collect(self.accounts, run=self.checkpoint.run_id)
+        results = self.merge_results(results)
         
         # 发送汇总通知
-        self.send_notification(results)
+        if self.work_queue or not self.use_async:
+            self.send_notification(results)
         
-        # 返回总体结果
-        success_count = sum(1 for _, success, _, _ in results if success)
+        # 导出本次运行的阶段耗时
+        metrics = get_run_metrics()
+        for email, success, result, balance in results:
+            metrics.annotate(email, success=success, result=result, balance=balance)
+        metrics.log_summary()
+        metrics.log_memory()
+        get_startup_profile().log_summary()
+        metrics.export()
+        
+        # 返回总体结果：按本分片的全部账号统计，失败或未处理的账号都算失败
+        unfinished = self.unfinished_accounts(results)
         logger.info(f"\n{'='*60}")
-        logger.info(f"📊 总体结果: {success_count}/{len(self.accounts)} 账号签到成功")
+        logger.info(f"📊 总体结果: {len(self.accounts) - len(unfinished)}/{len(self.accounts)} 账号签到成功")
+        if unfinished:
+            labels = ', '.join(mask_email(a['email']) for a in unfinished[:20])
+            logger.warning(f"⚠️ {len(unfinished)} 个账号未完成签到: {labels}{' ...' if len(unfinished) > 20 else ''}")
         logger.info(f"{'='*60}\n")
         
-        return success_count == len(self.accounts), results
+        return not unfinished, results
+    
+    def unfinished_accounts(self, results):
+        """本分片中失败或没有结果的账号；分布式模式下由其他节点完成的账号按队列状态计为已完成"""
+        outcomes = {email: success for email, success, _, _ in results}
+        unfinished = []
+        for account in self.accounts:
+            email = account['email']
+            if email in outcomes:
+                done = outcomes[email]
+            else:
+                done = self.queue_status.get(account_key(email)) == 'done'
+            if not done:
+                unfinished.append(account)
+        return unfinished
+    
+    def run_distributed(self, accounts):
+        """分布式模式：各工作线程从共享队列按租约领取账号，队列中没有待处理和进行中的账号时结束。
+        返回本节点处理的账号结果"""
+        work_queue = self.work_queue
+        by_key = {account_key(a['email']): a for a in accounts}
+        # 只领取本节点账号列表中的账号，其他节点的账号留给它们自己
+        work_queue.restrict(by_key)
+        results = []
+        results_lock = threading.Lock()
+        stop = threading.Event()
+        logger.info(f"🌐 分布式模式: 队列 {work_queue.path} ({work_queue.run_id})，节点 {work_queue.owner}，"
+                    f"租约 {work_queue.lease:.0f}秒")
+        
+        def heartbeat():
+            while not stop.wait(work_queue.lease / 3):
+                try:
+                    work_queue.heartbeat()
+                except sqlite3.Error as e:
+                    logger.warning(f"续租失败: {e}")
+        
+        def worker():
+            while True:
+                try:
+                    keys = work_queue.claim()
+                except sqlite3.Error as e:
+                    logger.warning(f"领取账号失败，稍后重试: {e}")
+                    time.sleep(1)
+                    continue
+                if not keys:
+                    # 本节点的账号都已完成（只剩其他节点的账号）时结束
+                    if not work_queue.outstanding(by_key):
+                        return
+                    # 其他节点仍持有本节点账号的租约：等待其完成，或租约过期后接手
+                    time.sleep(min(5.0, work_queue.lease / 4))
+                    continue
+                key = keys[0]
+                account = by_key[key]
+                with results_lock:
+                    index = len(results) + 1
+                email, success, result, balance = self._run_account(index, account)
+                work_queue.complete(key, success, result)
+                with results_lock:
+                    results.append((email, success, result, balance))
+        
+        beat = threading.Thread(target=heartbeat, name="queue-heartbeat", daemon=True)
+        beat.start()
+        try:
+            workers = [threading.Thread(target=worker, name=f"queue-{i}") for i in range(self.workers)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+        finally:
+            stop.set()
+            counts = work_queue.counts()
+            self.queue_status = work_queue.statuses()
+            work_queue.close()
+        logger.info(f"🌐 队列状态: {counts}，本节点处理 {len(results)} 个账号")
+        return results
+    
+    def run_concurrent(self, accounts):
+        """并发模式：每个工作线程各自持有独立的浏览器，结果按账号顺序返回"""
+        workers = min(self.workers, len(accounts))
+        logger.info(f"⚡ 并发模式: {workers} 个浏览器工作线程")
+        
+        results = [None] * len(accounts)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="checkin") as executor:
+            futures = {
+                executor.submit(self._run_account, i, account): i - 1
+                for i, account in enumerate(accounts, 1)
+            }
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    error_msg = f"处理账号时发生异常: {str(e)}"
+                    logger.error(f"❌ {error_msg}")
+                    results[idx] = (accounts[idx]['email'], False, error_msg, "未知")
+        
+        return results
+
+
+class BrowserPool:
+    """守护进程的浏览器池：预先启动 warm 个Chrome，账号需要浏览器时直接借用，用完归还"""
+    
+    def __init__(self, size, warm=0):
+        self.browsers = [BrowserLifecycle() for _ in range(max(1, size))]
+        self.idle = queue.LifoQueue()
+        for browser in self.browsers:
+            self.idle.put(browser)
+        self.warm_count = min(warm, len(self.browsers))
+    
+    def warm_up(self):
+        """在后台线程中启动前 warm 个浏览器"""
+        def launch(browser):
+            try:
+                browser.warm()
+                logger.info("🔥 预热浏览器已启动")
+            except Exception as e:
+                logger.warning(f"预热浏览器失败: {e}")
+        for browser in self.browsers[:self.warm_count]:
+            threading.Thread(target=launch, args=(browser,), name="browser-warm", daemon=True).start()
+    
+    @contextlib.contextmanager
+    def lease(self):
+        browser = self.idle.get()
+        try:
+            yield browser
+        finally:
+            self.idle.put(browser)
+    
+    def stats(self):
+        return {
+            'size': len(self.browsers),
+            'idle': self.idle.qsize(),
+            'running': sum(1 for b in self.browsers if b.driver is not None),
+            'launches': sum(b.launches for b in self.browsers),
+        }
+    
+    def close(self):
+        for browser in self.browsers:
+            browser.close()
+
+
+class DailySchedule:
+    """把每个账号每天的签到时间稳定地分散到时间窗口内（LEAFLOW_TZ 时区），避免所有账号同时请求"""
+    
+    def __init__(self, window=None):
+        window = window or os.getenv('LEAFLOW_DAEMON_WINDOW', '08:00-22:00')
+        try:
+            start, end = [self._minutes(part) for part in window.split('-', 1)]
+        except ValueError:
+            logger.warning(f"⚠️ LEAFLOW_DAEMON_WINDOW 格式错误: {window}，使用 08:00-22:00")
+            start, end = 8 * 60, 22 * 60
+        self.start = start
+        self.end = max(end, start + 1)
+    
+    @staticmethod
+    def _minutes(value):
+        hour, _, minute = value.strip().partition(':')
+        return int(hour) * 60 + int(minute or 0)
+    
+    def day_start(self, now):
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    def slot(self, email, now):
+        """账号在 now 所在日期的签到时间"""
+        span = (self.end - self.start) * 60
+        seed = hashlib.sha256(f"{account_key(email)}:{now.date().isoformat()}".encode('utf-8')).hexdigest()
+        return self.day_start(now) + timedelta(minutes=self.start, seconds=int(seed[:8], 16) % span)
+    
+    def window_end(self, now):
+        return self.day_start(now) + timedelta(minutes=self.end)
+    
+    def next_run(self, email, now, done_today):
+        """今天未完成时返回今天的时间（已过则立即执行），否则返回明天的时间"""
+        if not done_today:
+            return max(now, self.slot(email, now))
+        return self.slot(email, self.day_start(now) + timedelta(days=1, hours=12))
+
+
+class CheckinDaemon:
+    """常驻模式：复用预热的浏览器池，按每日时间窗口调度各账号签到，失败按退避重试；
+    账号文件变化或收到 SIGHUP 时重新加载账号，并通过本地HTTP端口提供运行状态。
+    """
+    
+    def __init__(self, manager):
+        self.manager = manager
+        self.schedule = DailySchedule()
+        self.retry = RetryPolicy(
+            attempts=max(1, env_number('LEAFLOW_DAEMON_RETRIES', 6, int)),
+            base=env_number('LEAFLOW_DAEMON_RETRY_MINUTES', 15.0) * 60,
+            cap=4 * 3600,
+        )
+        default_warm = 0 if os.getenv('LEAFLOW_HTTP_FIRST', '1').strip() != '0' else manager.workers
+        self.pool = BrowserPool(manager.workers, env_number('LEAFLOW_DAEMON_WARM', default_warm, int))
+        self.executor = ThreadPoolExecutor(max_workers=manager.workers, thread_name_prefix="daemon")
+        self.status_addr = os.getenv('LEAFLOW_STATUS_ADDR', '127.0.0.1:8790').strip()
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.wake = threading.Event()
+        self.reload_requested = False
+        self.accounts_mtime = self._accounts_mtime()
+        self.started_at = local_now()
+        self.day = self.started_at.date()
+        self.due = {}
+        self.failures = {}
+        self.running = set()
+        self.outbox = []
+        self.status = {}
+        self.server = None
+    
+    @staticmethod
+    def _accounts_mtime():
+        path = os.getenv('LEAFLOW_ACCOUNTS_FILE', '').strip()
+        try:
+            return os.path.getmtime(path) if path else None
+        except OSError:
+            return None
+    
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        signal.signal(signal.SIGINT, lambda *_: self.stop())
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda *_: self.request_reload())
+        
+        logger.info(f"🛰️ 守护进程启动: {len(self.manager.accounts)} 个账号，工作线程 {self.manager.workers}，"
+                    f"时间窗口 {self.schedule.start // 60:02d}:{self.schedule.start % 60:02d}-"
+                    f"{self.schedule.end // 60:02d}:{self.schedule.end % 60:02d}")
+        self.pool.warm_up()
+        self.start_status_server()
+        try:
+            while not self.stopping:
+                self.maybe_reload()
+                self.rollover()
+                self.plan()
+                self.dispatch_due()
+                self.flush_notifications()
+                self.wake.wait(self.sleep_seconds())
+                self.wake.clear()
+        finally:
+            logger.info("🛑 守护进程退出，等待进行中的账号完成...")
+            self.executor.shutdown(wait=True)
+            self.flush_notifications(force=True)
+            if self.server:
+                self.server.shutdown()
+                self.server.server_close()
+            self.pool.close()
+            self.manager.ledger.close()
+            self.manager.checkpoint.close()
+            get_debug_capture().flush()
+            get_run_metrics().export()
+    
+    def stop(self):
+        self.stopping = True
+        self.wake.set()
+    
+    def request_reload(self):
+        self.reload_requested = True
+        self.wake.set()
+    
+    def maybe_reload(self):
+        """账号文件修改或收到 SIGHUP 后重新加载账号列表"""
+        mtime = self._accounts_mtime()
+        if not self.reload_requested and mtime == self.accounts_mtime:
+            return
+        self.reload_requested = False
+        self.accounts_mtime = mtime
+        try:
+            accounts = self.manager.load_accounts()
+        except Exception as e:
+            logger.error(f"❌ 重新加载账号失败，继续使用原账号列表: {e}")
+            return
+        with self.lock:
+            emails = {a['email'] for a in accounts}
+            for email in list(self.due):
+                if email not in emails:
+                    del self.due[email]
+            self.manager.accounts = accounts
+            self.manager.total = len(accounts)
+        logger.info(f"🔄 已重新加载账号列表: {len(accounts)} 个账号")
+    
+    def rollover(self):
+        """跨天时导出前一天的耗时报告并清空，避免常驻进程内存增长"""
+        today = local_now().date()
+        if today == self.day:
+            return
+        metrics = get_run_metrics()
+        metrics.log_summary()
+        metrics.export()
+        metrics.reset()
+        self.day = today
+        with self.lock:
+            self.failures = {}
+    
+    def plan(self):
+        now = local_now()
+        with self.lock:
+            for account in self.manager.accounts:
+                email = account['email']
+                if email in self.due or email in self.running:
+                    continue
+                done = self.manager.ledger.completed_today(email) is not None
+                self.due[email] = self.schedule.next_run(email, now, done)
+    
+    def dispatch_due(self):
+        now = local_now()
+        with self.lock:
+            accounts = {a['email']: a for a in self.manager.accounts}
+            ready = [email for email, at in self.due.items() if at <= now and email in accounts]
+            for email in ready:
+                del self.due[email]
+                self.running.add(email)
+        for email in ready:
+            self.executor.submit(self._run, accounts[email])
+    
+    def _run(self, account):
+        email = account['email']
+        started = time.monotonic()
+        index = self.manager.accounts.index(account) + 1 if account in self.manager.accounts else 0
+        try:
+            with self.pool.lease() as browser:
+                email, success, result, balance = self.manager._run_account(index, account, browser=browser)
+        except Exception as e:
+            success, result, balance = False, f"处理账号时发生异常: {str(e)}", "未知"
+        duration = round(time.monotonic() - started, 3)
+        get_run_metrics().annotate(email, success=success, result=result, balance=balance, duration=duration)
+        
+        now = local_now()
+        with self.lock:
+            if success:
+                self.failures.pop(email, None)
+                next_run = self.schedule.next_run(email, now, True)
+            else:
+                failures = self.failures.get(email, 0)
+                self.failures[email] = failures + 1
+                delay = self.retry.backoff(HttpTransientError(result), failures)
+                next_run = now + timedelta(seconds=delay) if delay is not None else None
+                if next_run is None or next_run > self.schedule.window_end(now):
+                    next_run = self.schedule.next_run(email, now, True)
+            self.due[email] = next_run
+            self.running.discard(email)
+            self.outbox.append((email, success, result, balance))
+            self.status[email] = {
+                'account': account_label(email),
+                'success': success,
+                'result': result,
+                'balance': balance,
+                'duration': duration,
+                'last_run': now.isoformat(timespec='seconds'),
+                'failures_today': self.failures.get(email, 0),
+            }
+        logger.info(f"📅 {mask_email(email)} 下次执行: {next_run.isoformat(timespec='minutes')}")
+        self.wake.set()
+    
+    def flush_notifications(self, force=False):
+        """当前没有进行中的账号时，把这一批结果汇总发送一次"""
+        with self.lock:
+            if not self.outbox or (self.running and not force):
+                return
+            batch, self.outbox = self.outbox, []
+        self.manager.send_notification(batch)
+        get_run_metrics().export()
+    
+    def sleep_seconds(self):
+        now = local_now()
+        with self.lock:
+            upcoming = [(at - now).total_seconds() for at in self.due.values()]
+        # 至少每30秒检查一次账号文件和跨天
+        return max(1.0, min([30.0] + upcoming))
+    
+    def snapshot(self):
+        with self.lock:
+            accounts = []
+            for account in self.manager.accounts:
+                email = account['email']
+                entry = dict(self.status.get(email, {'account': account_label(email)}))
+                entry['running'] = email in self.running
+                next_run = self.due.get(email)
+                entry['next_run'] = next_run.isoformat(timespec='seconds') if next_run else None
+                accounts.append(entry)
+        phases = [dict(phase=phase, engine=engine, **st) for (phase, engine), st in get_run_metrics().phase_stats().items()]
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'now': local_now().isoformat(timespec='seconds'),
+            'browsers': self.pool.stats(),
+            'accounts': accounts,
+            'phases': phases,
+        }
+    
+    def start_status_server(self):
+        """在 LEAFLOW_STATUS_ADDR（默认 127.0.0.1:8790，设为 0 关闭）提供 /status 和 /metrics"""
+        if not self.status_addr or self.status_addr == '0':
+            return
+        host, _, port = self.status_addr.rpartition(':')
+        daemon = self
+        
+        class StatusHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+            
+            def do_GET(self):
+                if self.path.startswith('/metrics'):
+                    body, content_type = get_run_metrics().to_prometheus(), 'text/plain; version=0.0.4'
+                elif self.path.startswith('/status') or self.path == '/':
+                    body, content_type = json.dumps(daemon.snapshot(), ensure_ascii=False, indent=1), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+        
+        try:
+            self.server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), StatusHandler)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ 状态端口启动失败 {self.status_addr}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="status", daemon=True).start()
+        logger.info(f"📡 状态接口: http://{self.status_addr}/status")
+
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='Leaflow 多账号自动签到')
+    parser.add_argument('--daemon', action='store_true',
+                        help='常驻模式：按每日时间窗口调度签到（也可设置 LEAFLOW_DAEMON=1）')
+    parser.add_argument('--shard', metavar='i/n',
+                        help='只处理第 i 个分片（i 从0开始，共 n 片），按账号哈希稳定划分（也可设置 LEAFLOW_SHARD）')
+    parser.add_argument('--resume', action='store_true',
+                        help='跳过今天结果检查点中已成功的账号，接着上次中断或失败的运行继续（也可设置 LEAFLOW_RESUME=1）')
+    args = parser.parse_args()
+    
     try:
-        manager = MultiAccountManager()
+        manager = MultiAccountManager(shard=args.shard, resume=args.resume)
+        if args.daemon or os.getenv('LEAFLOW_DAEMON', '').strip() == '1':
+            CheckinDaemon(manager).run_forever()
+            exit(0)
+        
         overall_success, detailed_results = manager.run_all()
         
         if overall_success:
             logger.info("🎉 所有账号签到成功")
             exit(0)
         else:
-            success_count = sum(1 for _, success, _, _ in detailed_results if success)
-            logger.warning(f"⚠️ 部分账号签到失败: {success_count}/{len(detailed_results)} 成功")
-            # 即使有失败，也不退出错误状态，因为可能部分成功
-            exit(0)
+            unfinished = len(manager.unfinished_accounts(detailed_results))
+            logger.warning(f"⚠️ 部分账号签到失败: {len(manager.accounts) - unfinished}/{len(manager.accounts)} 成功")
+            # 成功的账号已记入签到账本；返回非零让工作流不写今日完成标记，下次运行只处理未完成的账号
+            exit(2)
             
     except Exception as e:
         logger.error(f"❌ 脚本执行出错: {e}")
         import traceback
         traceback.print_exc()
         exit(1)
+    finally:
+        close_http_pool()
+
+get_startup_profile().mark('module_loaded')
 
 if __name__ == "__main__":
     main()
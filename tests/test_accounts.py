@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+
+from leaflow_checkin import _iter_json_array, in_shard, iter_account_file, parse_shard, split_account_pairs
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('a@x.com:p1', ['a@x.com:p1']),
+    ('a@x.com:p1,b@y.com:p2', ['a@x.com:p1', 'b@y.com:p2']),
+    # 邮箱账号的密码可以包含逗号
+    ('a@x.com:p,1,b@y.com:p2', ['a@x.com:p,1', 'b@y.com:p2']),
+    ('a@x.com:p,w:1', ['a@x.com:p,w:1']),
+    # 用户名账号按逗号直接拆分
+    ('user1:p1,user2:p2', ['user1:p1', 'user2:p2']),
+    ('user1:p1,b@y.com:p2', ['user1:p1', 'b@y.com:p2']),
+    # 换行总是分隔账号，行尾逗号忽略
+    ('a@x.com:p1,\nuser2:p2,\n\nb@y.com:p,3', ['a@x.com:p1', 'user2:p2', 'b@y.com:p,3']),
+    ('  a@x.com:p1 , b@y.com:p2  ', ['a@x.com:p1', 'b@y.com:p2']),
+    ('', []),
+])
+def test_split_account_pairs(text, expected):
+    assert split_account_pairs(text) == expected
+
+
+def test_split_account_pairs_keeps_username_after_email_password():
+    # 邮箱账号后面的 ",name:" 无法和密码区分，按密码处理（会记录警告）
+    assert split_account_pairs('a@x.com:pa,user2:p2') == ['a@x.com:pa,user2:p2']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64, 65536])
+def test_iter_json_array_across_chunk_boundaries(chunk_size):
+    data = [{'email': 'a@x.com', 'password': 'p,"q'}, 12345, 'text', True, None, [1, 2], {'nested': {'k': [3]}}]
+    text = ' ' + json.dumps(data, ensure_ascii=False, indent=1)
+    assert list(_iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == data
+
+
+def test_iter_json_array_accepts_an_accounts_object():
+    text = json.dumps({'accounts': [{'email': 'a@x.com', 'password': 'p'}]})
+    assert list(_iter_json_array(io.StringIO(text))) == [{'email': 'a@x.com', 'password': 'p'}]
+
+
+def test_iter_json_array_rejects_a_truncated_file():
+    with pytest.raises(ValueError):
+        list(_iter_json_array(io.StringIO('[{"email": "a@x.com"}, {"email": '), chunk_size=4))
+
+
+@pytest.mark.parametrize('name, content', [
+    ('accounts.json', '[{"email": "a@x.com", "password": "p1"}, {"Username": "user2", "pass": "p2"}, {"email": "c@x.com"}]'),
+    ('accounts.jsonl', '{"email": "a@x.com", "password": "p1"}\n{"user": "user2", "passwd": "p2"}\nnot json\n'),
+    ('accounts.csv', 'email,password\na@x.com,p1\nuser2,p2\nc@x.com,\n'),
+    ('accounts.txt', '# comment\na@x.com:p1\n\nuser2:p2\nbroken\n'),
+])
+def test_iter_account_file_formats(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding='utf-8')
+    accounts = [account for _, account in iter_account_file(str(path))]
+    assert accounts[:2] == [{'email': 'a@x.com', 'password': 'p1'}, {'email': 'user2', 'password': 'p2'}]
+    assert accounts[2:] == [None]
+
+
+@pytest.mark.parametrize('value, expected', [('', None), (None, None), ('0/1', (0, 1)), ('3/4', (3, 4))])
+def test_parse_shard(value, expected):
+    assert parse_shard(value) == expected
+
+
+@pytest.mark.parametrize('value', ['4/4', '-1/4', '0/0', '1', 'a/b'])
+def test_parse_shard_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
+
+
+def test_shards_partition_accounts_stably():
+    emails = [f'user{i}@example.com' for i in range(200)]
+    shards = [[e for e in emails if in_shard(e, (i, 4))] for i in range(4)]
+    assert sorted(sum(shards, [])) == sorted(emails)
+    assert all(shards)
+    # 大小写和空白不影响分片
+    assert in_shard(' USER0@Example.com ', (0, 4)) == in_shard('user0@example.com', (0, 4))
+    assert all(in_shard(e, None) for e in emails)
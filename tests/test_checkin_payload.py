@@ -0,0 +1,37 @@
+import pytest
+
+from leaflow_checkin import is_checkin_message, is_checkin_payload
+
+
+@pytest.mark.parametrize('payload, expected', [
+    ({'success': True, 'message': 'ok'}, True),
+    ({'success': False, 'message': '签到成功'}, False),
+    ({'message': '签到成功，获得 0.5 元'}, True),
+    ({'msg': '今日已签到'}, True),
+    ({'message': '您今天已经签到过了'}, True),
+    ({'message': '今日未签到'}, False),
+    ({'message': '签到失败'}, False),
+    ({'message': 'Check-in unsuccessful'}, False),
+    ({'msg': 'You have not checked in yet'}, False),
+    ({'message': 'success'}, False),
+    ({'status': 'ok'}, False),
+    ({'status': 'success'}, False),
+    ({'status': 'error', 'message': '签到成功'}, False),
+    ({}, False),
+    ([{'message': '签到成功'}], False),
+    ('签到成功', False),
+    (None, False),
+])
+def test_is_checkin_payload(payload, expected):
+    assert is_checkin_payload(payload) is expected
+
+
+@pytest.mark.parametrize('message, expected', [
+    ('签到成功', True),
+    ('签到没有成功', False),
+    ('无法签到', False),
+    ('', False),
+    (None, False),
+])
+def test_is_checkin_message(message, expected):
+    assert is_checkin_message(message) is expected
@@ -0,0 +1,47 @@
+import re
+
+from leaflow_checkin import chunk_message, format_result_block, telegram_length
+
+LIMIT = 4096
+
+
+def test_short_message_is_a_single_unnumbered_chunk():
+    header = "🎁 Leaflow自动签到通知\n\n"
+    blocks = [format_result_block('a@example.com', True, '签到成功', '1元')]
+    assert chunk_message(header, blocks) == [header + blocks[0]]
+
+
+def test_no_blocks_still_sends_the_header():
+    assert chunk_message("header\n", []) == ["header\n"]
+
+
+def test_chunks_respect_the_utf16_limit_and_keep_blocks_whole():
+    header = "🎁 Leaflow自动签到通知\n📊 成功: 300/300\n\n"
+    blocks = [format_result_block(f'user{i}@example.com', True, '签到成功 🎉', f'{i}元') for i in range(300)]
+    chunks = chunk_message(header, blocks)
+    assert len(chunks) > 1
+    assert all(telegram_length(chunk) <= LIMIT for chunk in chunks)
+    joined = ''.join(chunks)
+    for block in blocks:
+        assert block in joined
+    assert chunks[0].startswith(header)
+    assert chunks[0].endswith(f"（1/{len(chunks)}）")
+    assert chunks[1].startswith(f"（续 2/{len(chunks)}）\n")
+
+
+def test_oversized_block_is_truncated_below_the_limit():
+    block = format_result_block('a@example.com', False, '😀' * 5000, '未知')
+    chunks = chunk_message("header\n", [block])
+    assert all(telegram_length(chunk) <= LIMIT for chunk in chunks)
+    assert chunks[-1].endswith("…\n\n")
+
+
+def test_truncation_never_cuts_through_an_html_entity():
+    cut = (LIMIT - 100) // 2
+    for offset in range(1, 6):
+        # 让 "&amp;" 跨过截断位置
+        block = 'x' * (cut - offset) + '&amp;' * 2000
+        (chunk,) = chunk_message("", [block])
+        body = chunk[:-len("…\n\n")]
+        assert not re.search(r'&[a-z]*$', body)
+        assert body.count('&') == body.count(';')
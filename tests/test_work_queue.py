@@ -0,0 +1,116 @@
+import pytest
+
+from leaflow_checkin import WorkQueue, account_key
+
+
+def accounts(*emails):
+    return [{'email': email, 'password': 'p'} for email in emails]
+
+
+@pytest.fixture
+def queue_path(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEAFLOW_QUEUE_ATTEMPTS', '2')
+    return str(tmp_path / 'queue.db')
+
+
+@pytest.fixture
+def nodes(queue_path):
+    opened = []
+
+    def node():
+        queue = WorkQueue(queue_path, run_id='run')
+        opened.append(queue)
+        return queue
+    yield node
+    for queue in opened:
+        queue.close()
+
+
+def expire_leases(queue):
+    with queue.transaction() as conn:
+        conn.execute("UPDATE queue SET lease_until = 0 WHERE status = 'leased'")
+
+
+def test_claim_and_complete_in_position_order(nodes):
+    queue = nodes()
+    queue.seed(accounts('a@x.com', 'b@x.com'), done=[('b@x.com', '今日已签到')])
+    key = account_key('a@x.com')
+    assert queue.claim() == [key]
+    assert queue.claim() == []
+    assert queue.complete(key, True, '签到成功')
+    assert queue.statuses() == {key: 'done', account_key('b@x.com'): 'done'}
+    assert queue.outstanding({key: None}) == 0
+
+
+def test_failed_account_is_requeued_until_attempts_run_out(nodes):
+    queue = nodes()
+    queue.seed(accounts('a@x.com'))
+    key = account_key('a@x.com')
+    for _ in range(2):
+        assert queue.claim() == [key]
+        queue.complete(key, False, '失败')
+    assert queue.claim() == []
+    assert queue.statuses() == {key: 'failed'}
+
+
+def test_next_run_requeues_failed_accounts(nodes):
+    first = nodes()
+    first.seed(accounts('a@x.com'))
+    key = account_key('a@x.com')
+    for _ in range(2):
+        first.claim()
+        first.complete(key, False, '失败')
+    rerun = nodes()
+    rerun.seed(accounts('a@x.com'))
+    assert rerun.claim() == [key]
+
+
+def test_expired_lease_is_taken_over_and_the_old_owner_cannot_complete(nodes):
+    crashed, survivor = nodes(), nodes()
+    crashed.seed(accounts('a@x.com'))
+    key = account_key('a@x.com')
+    assert crashed.claim() == [key]
+    assert survivor.claim() == []
+    expire_leases(crashed)
+    assert survivor.claim() == [key]
+    assert not crashed.complete(key, True, '签到成功')
+    assert survivor.statuses() == {key: 'leased'}
+    assert survivor.complete(key, True, '签到成功')
+    assert survivor.statuses() == {key: 'done'}
+
+
+def test_expired_lease_without_attempts_left_is_marked_failed(nodes):
+    queue = nodes()
+    queue.seed(accounts('a@x.com'))
+    key = account_key('a@x.com')
+    queue.claim()
+    queue.complete(key, False, '失败')
+    queue.claim()
+    expire_leases(queue)
+    assert queue.claim() == []
+    assert queue.statuses() == {key: 'failed'}
+
+
+def test_heartbeat_extends_only_own_leases(nodes):
+    holder, other = nodes(), nodes()
+    holder.seed(accounts('a@x.com'))
+    holder.claim()
+    expire_leases(holder)
+    holder.heartbeat()
+    other.heartbeat()
+    assert other.claim() == []
+
+
+def test_restricted_node_never_leases_foreign_accounts(nodes):
+    foreign, local = nodes(), nodes()
+    # 其他节点的账号排在前面且数量超过旧实现的 500 个排除上限
+    foreign.seed(accounts(*(f'f{i}@x.com' for i in range(700))))
+    local.seed(accounts('me@x.com'))
+    key = account_key('me@x.com')
+    local.restrict({key: None})
+    assert local.claim() == [key]
+    assert local.claim() == []
+    assert local.counts() == {'pending': 700, 'leased': 1}
+    assert local.outstanding({key: None}) == 1
+    local.complete(key, True, '签到成功')
+    assert local.outstanding({key: None}) == 0